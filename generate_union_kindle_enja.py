@@ -4,7 +4,8 @@
 # Script to generate files to make a EnJa Kindle dictionary from the union dictionary
 #
 # Usage:
-#   generate_union_kindle_enja.py [--input str] [--output str] [--keyword str] [--quiet]
+#   generate_union_kindle_enja.py [--input str] [--output str] [--keyword str] [--workers num]
+#     [--quiet]
 #
 # Example:
 #   ./generate_union_kindle_enja.py --input union-body.tkh --output union-dict-epub
@@ -23,11 +24,12 @@ import collections
 import copy
 import datetime
 import html
-import json
 import logging
 import math
+import multiprocessing
 import os
 import pathlib
+import re
 import regex
 import sys
 import time
@@ -99,9 +101,9 @@ TEXT_ATTRS = {
   "transitive": "他",
   "derivative": "派",
 }
-ARTICLES = {
+ARTICLES = frozenset({
   "a", "the", "an",
-}
+})
 PARTICLES = {
   "aback", "about", "above", "abroad", "across", "after", "against", "ahead", "along",
   "amid", "among", "apart", "around", "as", "at", "away", "back", "before", "behind",
@@ -114,6 +116,7 @@ PARTICLES = {
 BASE_VETTED_VERBS = {
   "be", "have", "see",
 }
+PARENT_CACHE_CAPACITY = 4096
 CURRENT_UUID = str(uuid.uuid1())
 CURRENT_DATETIME = regex.sub(r"\..*", "Z", datetime.datetime.now(
   datetime.timezone.utc).isoformat())
@@ -290,12 +293,57 @@ def SanitizeText(text):
   return text
 
 
+def EscapeRegexLiteral(text):
+  if text.replace("'", "").replace("-", "").isalnum():
+    return text
+  return regex.escape(text)
+
+
+_regex_aux_tail = re.compile(r" \[-+\] .*")
+_regex_paren_expr = re.compile(r"\(.*?\)")
+_regex_bracket_expr = re.compile(r"\[.*?\]")
+def CleanTextForDupCheck(text):
+  if " [" in text:
+    text = _regex_aux_tail.sub("", text)
+  if "(" in text:
+    text = _regex_paren_expr.sub("", text)
+  if "[" in text:
+    text = _regex_bracket_expr.sub("", text)
+  return text.strip()
+
+
+_regex_ascii_upper = re.compile(r"[A-Z]")
+_regex_latin_noise = regex.compile(r"[^-_\p{Latin}\d']+")
+_regex_non_latin = regex.compile(r"[^\x20-\x7F\p{Latin}]")
+_regex_ordinal = regex.compile(r"\d+(th)?")
+_regex_lower_words = regex.compile(r"[a-z ]+")
+_regex_lower_word = regex.compile(r"[a-z]+")
+_regex_capital_token = regex.compile(r"(^| )[\p{Lu}\p{P}\p{S}\d]")
+_regex_multi_capitals = regex.compile(r"[A-Z].*[A-Z]")
+_regex_long_token = regex.compile(r"\w{20,}")
+_regex_item_attr = regex.compile(r"^\[([a-z]+)\]: ")
+_regex_item_annot = regex.compile(r"^ *[,、]*[\(（〔]([^\)）〕]+)[\)）〕]")
+_regex_annot_delims = regex.compile(r"[ ,、]")
+
+
+_main_page_context = None
+def MakeMainPageInWorker(task):
+  batch, args = _main_page_context
+  key_prefix, page_keys = task
+  batch.ResetStats()
+  input_dbm = tkrzw.DBM()
+  input_dbm.Open(batch.input_path, False, dbm="HashDBM").OrDie()
+  batch.MakeMainPage(key_prefix, page_keys, input_dbm, *args)
+  input_dbm.Close().OrDie()
+  return batch.GetStats()
+
+
 class GenerateUnionEPUBBatch:
   def __init__(self, input_path, output_path, keyword_path,
                best_labels, vetted_labels, preferable_labels, trustable_labels,
                synth_labels, supplement_labels, title,
                min_prob_normal, min_prob_capital, min_prob_multi, sufficient_prob,
-               shrink, fallback, example_only):
+               shrink, fallback, example_only, num_workers):
     self.input_path = input_path
     self.output_path = output_path
     self.keyword_path = keyword_path
@@ -313,6 +361,12 @@ class GenerateUnionEPUBBatch:
     self.shrink = shrink
     self.fallback = fallback
     self.example_only = example_only
+    self.num_workers = num_workers
+    self.ResetStats()
+    self.parent_cache = collections.OrderedDict()
+    self.tokenizer = tkrzw_tokenizer.Tokenizer()
+
+  def ResetStats(self):
     self.num_words = 0
     self.num_trans = 0
     self.num_items = 0
@@ -321,7 +375,23 @@ class GenerateUnionEPUBBatch:
     self.num_redirections = 0
     self.num_collocations = 0
     self.label_counters = collections.defaultdict(int)
-    self.tokenizer = tkrzw_tokenizer.Tokenizer()
+
+  def GetStats(self):
+    counts = (self.num_words, self.num_trans, self.num_items, self.num_aux_items,
+              self.num_inflections, self.num_redirections, self.num_collocations)
+    return counts, dict(self.label_counters)
+
+  def AddStats(self, stats):
+    counts, label_counters = stats
+    self.num_words += counts[0]
+    self.num_trans += counts[1]
+    self.num_items += counts[2]
+    self.num_aux_items += counts[3]
+    self.num_inflections += counts[4]
+    self.num_redirections += counts[5]
+    self.num_collocations += counts[6]
+    for label, count in label_counters.items():
+      self.label_counters[label] += count
 
   def Run(self):
     start_time = time.time()
@@ -366,7 +436,7 @@ class GenerateUnionEPUBBatch:
     while True:
       rec = it.GetStr()
       if rec == None: break
-      entries = json.loads(rec[1])
+      entries = tkrzw_dict.LoadJSON(rec[1])
       for entry in entries:
         word = entry["word"]
         core = entry.get("etymology_core")
@@ -387,9 +457,9 @@ class GenerateUnionEPUBBatch:
 
   def IsGoodEntry(self, entry, input_dbm, keywords):
     word = entry["word"]
-    if regex.search(r"[^\x20-\x7F\p{Latin}]", word):
+    if _regex_non_latin.search(word):
       return False
-    if regex.fullmatch(r"\d+(th)?", word):
+    if _regex_ordinal.fullmatch(word):
       return False
     if self.fallback:
       return True
@@ -410,7 +480,7 @@ class GenerateUnionEPUBBatch:
       return False
     if word in keywords:
       return True
-    if regex.search(r"[A-Z]", word) and prob < self.min_prob_capital:
+    if _regex_ascii_upper.search(word) and prob < self.min_prob_capital:
       return False
     if word.find(" ") >= 0 and prob < self.min_prob_multi:
       return False
@@ -418,7 +488,7 @@ class GenerateUnionEPUBBatch:
       return False
     if prob >= self.sufficient_prob:
       return True
-    if "verb" in poses and regex.fullmatch(r"[a-z ]+", word):
+    if "verb" in poses and _regex_lower_words.fullmatch(word):
       tokens = word.split(" ")
       if len(tokens) >= 2 and tokens[0] in keywords:
         particle_suffix = True
@@ -432,15 +502,14 @@ class GenerateUnionEPUBBatch:
     if translations and len(labels) >= 2 and not self.example_only:
       if "verb" in poses or "adjective" in poses or "adverb" in poses:
         return True
-      if regex.fullmatch("[a-z]+", word) and "we" in labels:
+      if _regex_lower_word.fullmatch(word) and "we" in labels:
         return True
     has_parent = False
     parents = entry.get("parent")
     if parents:
       for parent in parents:
-        parent_entry = input_dbm.Get(parent)
-        if not parent_entry: return
-        parent_entries = json.loads(parent_entry)
+        parent_entries = self.GetParentEntries(parent, input_dbm)
+        if not parent_entries: return
         for parent_entry in parent_entries:
           match_infl = False
           if float(parent_entry.get("probability") or "0") < 0.00005: continue
@@ -451,9 +520,9 @@ class GenerateUnionEPUBBatch:
                 match_infl = True
           if not match_infl:
             return True
-    if (regex.search(r"(^| )[\p{Lu}\p{P}\p{S}\d]", word) and "we" not in labels):
+    if (_regex_capital_token.search(word) and "we" not in labels):
       return False
-    if regex.search(r" ", word):
+    if " " in word:
       return False
     if len(labels) == 1:
       return False
@@ -465,7 +534,7 @@ class GenerateUnionEPUBBatch:
     for key in keys:
       serialized = input_dbm.GetStr(key)
       if not serialized: continue
-      entries = json.loads(serialized)
+      entries = tkrzw_dict.LoadJSON(serialized)
       for entry in entries:
         word = entry["word"]
         prob = float(entry.get("probability") or 0)
@@ -489,31 +558,44 @@ class GenerateUnionEPUBBatch:
     boss_words = {}
     for rel_word, pair in rel_probs.items():
       boss_words[rel_word] = pair[1]
-    out_files = {}
+    prefix_keys = collections.defaultdict(list)
     for key in keys:
-      key_prefix = GetKeyPrefix(key)
-      out_file = out_files.get(key_prefix)
-      if not out_file:
-        out_path = os.path.join(self.output_path, "main-{}.xhtml".format(key_prefix))
-        logger.info("Creating: {}".format(out_path))
-        out_file = open(out_path, "w")
-        out_files[key_prefix] = out_file
-        page_title = "etc." if key_prefix == "_" else key_prefix.upper()
-        print(MAIN_HEADER_TEXT.format(esc(self.title), esc(page_title), esc(page_title)),
-              file=out_file, end="")
-      serialized = input_dbm.GetStr(key)
-      if not serialized: continue
-      entries = json.loads(serialized)
-      for entry in entries:
-        word = entry["word"]
-        share = entry.get("share")
-        min_share = 0.3 if regex.search("[A-Z]", word) else 0.2
-        if share and float(share) < min_share: break
-        self.MakeMainEntry(out_file, entry, input_dbm, etym_dict, infl_dict,
-                           keys, inflections, boss_words)
-    for key_prefix, out_file in out_files.items():
+      prefix_keys[GetKeyPrefix(key)].append(key)
+    tasks = list(prefix_keys.items())
+    page_args = (etym_dict, infl_dict, keys, inflections, boss_words)
+    num_workers = min(self.num_workers, len(tasks))
+    if num_workers <= 1:
+      for key_prefix, page_keys in tasks:
+        self.MakeMainPage(key_prefix, page_keys, input_dbm, *page_args)
+      return
+    global _main_page_context
+    _main_page_context = (self, page_args)
+    with multiprocessing.get_context("fork").Pool(num_workers) as pool:
+      for stats in pool.imap_unordered(MakeMainPageInWorker, tasks):
+        self.AddStats(stats)
+    _main_page_context = None
+
+  def MakeMainPage(self, key_prefix, page_keys, input_dbm, etym_dict, infl_dict,
+                   keys, inflections, boss_words):
+    out_path = os.path.join(self.output_path, "main-{}.xhtml".format(key_prefix))
+    logger.info("Creating: {}".format(out_path))
+    with open(out_path, "w") as out_file:
+      page_title = "etc." if key_prefix == "_" else key_prefix.upper()
+      print(MAIN_HEADER_TEXT.format(esc(self.title), esc(page_title), esc(page_title)),
+            file=out_file, end="")
+      for key in page_keys:
+        serialized = input_dbm.GetStr(key)
+        if not serialized: continue
+        entries = tkrzw_dict.LoadJSON(serialized)
+        for entry in entries:
+          word = entry["word"]
+          share = entry.get("share")
+          if share:
+            min_share = 0.3 if _regex_ascii_upper.search(word) else 0.2
+            if float(share) < min_share: break
+          self.MakeMainEntry(out_file, entry, input_dbm, etym_dict, infl_dict,
+                             keys, inflections, boss_words)
       print(MAIN_FOOTER_TEXT, file=out_file, end="")
-      out_file.close()
 
   def MakeMainEntry(self, out_file, entry, input_dbm, etym_dict, infl_dict,
                     keys, inflections, boss_words):
@@ -529,7 +611,7 @@ class GenerateUnionEPUBBatch:
     pronunciation = entry.get("pronunciation")
     translations = entry.get("translation")
     examples = entry.get("example")
-    is_major_word = prob >= 0.00001 and not regex.search("[A-Z]", word)
+    is_major_word = prob >= 0.00001 and not _regex_ascii_upper.search(word)
     if self.example_only and not examples: return
     poses = set()
     sub_poses = set()
@@ -551,7 +633,7 @@ class GenerateUnionEPUBBatch:
     if not poses:
       poses = sub_poses
     infl_groups = collections.defaultdict(list)
-    if not regex.search(r"[A-Z].*[A-Z]", word):
+    if not _regex_multi_capitals.search(word):
       for attr_list in INFLECTIONS:
         for name, label in attr_list:
           pos, suffix = name.split("_", 1)
@@ -585,10 +667,10 @@ class GenerateUnionEPUBBatch:
           if not is_best and not is_vetted and not CheckSafeText(text):
             length_cost += 10.0
           if text.startswith("[translation]:"): continue
-          text = regex.sub(r" \[-+\] .*", "", text).strip()
+          text = _regex_aux_tail.sub("", text).strip()
           if not text: continue
           num_items += 1
-          text = regex.sub(r"[^-_\p{Latin}\d']+", " ", text).strip()
+          text = _regex_latin_noise.sub(" ", text).strip()
           num_words = text.count(" ") + 1
           length_cost += abs(math.log(9) - math.log(num_words))
         if not num_items: continue
@@ -621,7 +703,7 @@ class GenerateUnionEPUBBatch:
         tran_items.append(item)
       elif label == best_label:
         items.append(item)
-      elif label in main_labels and is_major_word and not regex.search(r"\w{20,}", text):
+      elif label in main_labels and is_major_word and not _regex_long_token.search(text):
         sub_items.append(item)
     if not items:
       items = sub_items
@@ -724,7 +806,7 @@ class GenerateUnionEPUBBatch:
           "verb_singular", "verb_present_participle",
           "verb_past", "verb_past_participle", "alternative"], False):
         P('<idx:orth value="{}"></idx:orth>', participle)
-    elif (regex.fullmatch("[a-z]+", word) and word not in PARTICLES and
+    elif (_regex_lower_word.fullmatch(word) and word not in PARTICLES and
           pronunciation and translations and is_vetted_verb and prob >= 0.000001 and
           len(label_items) >= 2):
       for participle in GetParticiples(["verb_present_participle", "verb_past_participle"], True):
@@ -747,8 +829,16 @@ class GenerateUnionEPUBBatch:
           num_examples = 4
         else:
           num_examples = 3
+        highlights = {word.lower()}
+        for attr_list in INFLECTIONS:
+          for name, _ in attr_list:
+            for infl in entry.get(name) or []:
+              highlights.add(infl)
+        core_expr = "|".join([EscapeRegexLiteral(x) for x in highlights])
+        phrase_regex = regex.compile(r"(?i)(^|\W)(" + core_expr + r")(\W|$)")
+        lower_highlights = tuple(set([x.lower() for x in highlights]))
         for example in examples[:num_examples]:
-          self.MakeMainEntryExampleItem(P, example, entry)
+          self.MakeMainEntryExampleItem(P, example, lower_highlights, phrase_regex)
     else:
       for item in items:
         self.MakeMainEntryItem(P, item)
@@ -773,23 +863,23 @@ class GenerateUnionEPUBBatch:
     pos = item["pos"]
     text = SanitizeText(item["text"])
     annots = []
-    attr_match = regex.search(r"^\[([a-z]+)\]: ", text)
+    attr_match = _regex_item_attr.search(text)
     if attr_match:
       if attr_match.group(1) == "translation":
         annots.append("訳語")
       text = text[len(attr_match.group(0)):].strip()
     while True:
       attr_label = None
-      attr_match = regex.search(r"^ *[,、]*[\(（〔]([^\)）〕]+)[\)）〕]", text)
+      attr_match = _regex_item_annot.search(text)
       if not attr_match: break
-      for name in regex.split(r"[ ,、]", attr_match.group(1)):
+      for name in _regex_annot_delims.split(attr_match.group(1)):
         attr_label = TEXT_ATTRS.get(name)
         if attr_label: break
       if not attr_label: break
       text = text[len(attr_match.group(0)):].strip()
       annots.append(attr_label)
     self.num_items += 1
-    text = regex.sub(r" \[-+\] .*", "", text).strip()
+    text = _regex_aux_tail.sub("", text).strip()
     text = CutTextByWidth(text, 160)
     P('<div>')
     leader = ""
@@ -809,58 +899,61 @@ class GenerateUnionEPUBBatch:
     P('</div>')
     self.num_collocations += 1
 
+  def GetParentEntries(self, parent, input_dbm):
+    entries = self.parent_cache.get(parent)
+    if entries is not None:
+      self.parent_cache.move_to_end(parent)
+      return entries
+    serialized = input_dbm.Get(parent)
+    entries = tkrzw_dict.LoadJSON(serialized) if serialized else []
+    self.parent_cache[parent] = entries
+    if len(self.parent_cache) > PARENT_CACHE_CAPACITY:
+      self.parent_cache.popitem(last=False)
+    return entries
+
   def MakeMainEntryParentItem(self, P, parent, input_dbm):
-    parent_entry = input_dbm.Get(parent)
-    if not parent_entry: return
-    entries = json.loads(parent_entry)
+    entries = self.GetParentEntries(parent, input_dbm)
     for entry in entries:
       word = entry["word"]
       share = entry.get("share")
-      min_share = 0.5 if regex.search("[A-Z]", word) else 0.25
-      if share and float(share) < min_share: break
+      if share:
+        min_share = 0.5 if _regex_ascii_upper.search(word) else 0.25
+        if float(share) < min_share: break
       translations = entry.get("translation")
       if translations:
         text = ", ".join(translations[:4])
       else:
         text = entry["item"][0]["text"]
-        text = regex.sub(r" \[-+\] .*", "", text).strip()
+        text = _regex_aux_tail.sub("", text).strip()
       if text:
         P('<div>')
         P('<span class="attr">[語幹]</span>')
         P('<span>{} : {}</span>', word, text)
         P('</div>')
 
-  def MakeMainEntryExampleItem(self, P, example, entry):
-    highlights = {entry["word"].lower()}
-    for attr_list in INFLECTIONS:
-      fields = []
-      for name, label in attr_list:
-        value = entry.get(name)
-        if value:
-          for infl in value:
-            highlights.add(infl)
+  def MakeMainEntryExampleItem(self, P, example, lower_highlights, phrase_regex):
     P('<div>')
     P('<span class="attr">&#x2023;</span>')
     P('<span class="exen">', end="")
-    highlights = [regex.escape(x) for x in highlights]
-    core_expr = "|".join(highlights)
-    phrase_regex = regex.compile(r"(?i)(^|\W)(" + core_expr + r")(\W|$)")
     text = example["e"]
+    lower_text = text.lower()
+    has_highlight = any(x in lower_text for x in lower_highlights)
+    chunk_formats = []
+    chunk_args = []
     while True:
-      match = phrase_regex.search(text)
+      match = phrase_regex.search(text) if has_highlight else None
       if match:
         pos = match.span()[0]
-        if pos > 0:
-          P('{}', text[:pos], end="")
-        P('{}', match.group(1), end="")
-        P('<b>{}</b>', match.group(2), end="")
-        P('{}', match.group(3), end="")
+        chunk_formats.append('{}{}<b>{}</b>{}')
+        chunk_args.extend([text[:pos], match.group(1), match.group(2), match.group(3)])
         pos = match.span()[1]
         text = text[pos:]
       else:
         if text:
-          P('{}', text, end="")
+          chunk_formats.append('{}')
+          chunk_args.append(text)
         break
+    P("".join(chunk_formats), *chunk_args, end="")
     P('</span>')
     P('<span class="exja">({})</span>', example["j"])
     P('</div>')
@@ -868,15 +961,15 @@ class GenerateUnionEPUBBatch:
   def MakeNavigation(self, key_prefixes):
     out_path = os.path.join(self.output_path, "nav.xhtml")
     logger.info("Creating: {}".format(out_path))
+    parts = [NAVIGATION_HEADER_TEXT.format(esc(self.title), esc(self.title))]
+    for key_prefix in key_prefixes:
+      main_path = "main-{}.xhtml".format(key_prefix)
+      page_title = "etc." if key_prefix == "_" else key_prefix.upper()
+      parts.append('<li><a href="{}">Words: {}</a></li>\n'.format(
+        esc(main_path), esc(page_title)))
+    parts.append(NAVIGATION_FOOTER_TEXT)
     with open(out_path, "w") as out_file:
-      print(NAVIGATION_HEADER_TEXT.format(esc(self.title), esc(self.title)),
-            file=out_file, end="")
-      for key_prefix in key_prefixes:
-        main_path = "main-{}.xhtml".format(key_prefix)
-        page_title = "etc." if key_prefix == "_" else key_prefix.upper()
-        print('<li><a href="{}">Words: {}</a></li>'.format(esc(main_path), esc(page_title)),
-              file=out_file)
-      print(NAVIGATION_FOOTER_TEXT, file=out_file, end="")
+      out_file.write("".join(parts))
 
   def MakeOverview(self):
     out_path = os.path.join(self.output_path, "overview.xhtml")
@@ -896,29 +989,31 @@ class GenerateUnionEPUBBatch:
   def MakePackage(self, key_prefixes):
     out_path = os.path.join(self.output_path, "package.opf")
     logger.info("Creating: {}".format(out_path))
+    mains = [("main_" + x, "main-{}.xhtml".format(x)) for x in key_prefixes]
+    parts = [PACKAGE_HEADER_TEXT.format(CURRENT_UUID, esc(self.title), CURRENT_DATETIME)]
+    parts.extend(['<item id="{}" href="{}" media-type="application/xhtml+xml"/>\n'.format(
+      main_id, main_path) for main_id, main_path in mains])
+    parts.append(PACKAGE_MIDDLE_TEXT)
+    parts.extend(['<itemref idref="{}"/>\n'.format(main_id) for main_id, _ in mains])
+    parts.append(PACKAGE_FOOTER_TEXT)
     with open(out_path, "w") as out_file:
-      print(PACKAGE_HEADER_TEXT.format(CURRENT_UUID, esc(self.title), CURRENT_DATETIME),
-            file=out_file, end="")
-      main_ids = []
-      for key_prefix in key_prefixes:
-        main_path = "main-{}.xhtml".format(key_prefix)
-        main_id = "main_" + key_prefix
-        print('<item id="{}" href="{}" media-type="application/xhtml+xml"/>'.format(
-          main_id, main_path), file=out_file)
-        main_ids.append(main_id)
-      print(PACKAGE_MIDDLE_TEXT, file=out_file, end="")
-      for main_id in main_ids:
-        print('<itemref idref="{}"/>'.format(main_id), file=out_file)
-      print(PACKAGE_FOOTER_TEXT, file=out_file, end="")
+      out_file.write("".join(parts))
 
   def TokenizeForDupCheck(self, text):
     tokens = []
     for token in self.tokenizer.Tokenize("en", text, True, True):
-      token = regex.sub(r"[^-_\p{Latin}\d']+", "", token).strip()
+      token = _regex_latin_noise.sub("", token)
       if not token or token in ARTICLES: continue
       tokens.append(token)
     return tokens
 
+  def GetDupCheckTokens(self, item):
+    tokens = item.get("_dup_tokens")
+    if tokens is None:
+      tokens = self.TokenizeForDupCheck(CleanTextForDupCheck(item["text"]))
+      item["_dup_tokens"] = tokens
+    return tokens
+
   def MergeShownItems(self, items, sub_items):
     if self.shrink:
       min_shown_items = 3
@@ -936,24 +1031,19 @@ class GenerateUnionEPUBBatch:
     if len(merged_items) < min_shown_items and sub_items:
       references = []
       for item in merged_items:
-        text = item["text"]
-        text = regex.sub(r" \[-+\] .*", "", text).strip()
-        text = regex.sub(r"\(.*?\)", "", text).strip()
-        text = regex.sub(r"\[.*?\]", "", text).strip()
-        tokens = self.TokenizeForDupCheck(text)
+        tokens = self.GetDupCheckTokens(item)
         if tokens:
           references.append(tokens)
+      merged_ref_maps = tkrzw_dict.MergeReferenceNGramMaps(references, 3)
       for item in sub_items:
         if len(merged_items) >= mid_shown_items: break
         text = item["text"]
         if not CheckSafeText(text): continue
         if references:
-          text = regex.sub(r" \[-+\] .*", "", text).strip()
-          text = regex.sub(r"\(.*?\)", "", text).strip()
-          text = regex.sub(r"\[.*?\]", "", text).strip()
-          candidate = self.TokenizeForDupCheck(text)
+          candidate = self.GetDupCheckTokens(item)
           if not candidate: continue
-          dup_score = tkrzw_dict.ComputeNGramPresision(candidate, references, 3)
+          dup_score = tkrzw_dict.ComputeNGramPresision(
+            candidate, references, 3, merged_ref_maps)
           if dup_score >= max_dup_score: continue
         item["is_aux"] = True
         merged_items.append(item)
@@ -981,6 +1071,7 @@ def main():
   shrink = tkrzw_dict.GetCommandFlag(args, "--shrink", 0)
   fallback = tkrzw_dict.GetCommandFlag(args, "--fallback", 0)
   example_only = tkrzw_dict.GetCommandFlag(args, "--example_only", 0)
+  num_workers = int(tkrzw_dict.GetCommandFlag(args, "--workers", 1) or os.cpu_count() or 1)
   if not input_path:
     raise RuntimeError("an input path is required")
   if not output_path:
@@ -990,7 +1081,7 @@ def main():
     best_labels, vetted_labels, preferable_labels, trustable_labels,
     synth_labels, supplement_labels, title,
     min_prob_normal, min_prob_capital, min_prob_multi, sufficient_prob,
-    shrink, fallback, example_only).Run()
+    shrink, fallback, example_only, num_workers).Run()
 
 
 if __name__=="__main__":
@@ -4,7 +4,8 @@
 # Script to generate files to make a JaEn Kindle dictionary from the union dictionary
 #
 # Usage:
-#   generate_union_kindle_jaen.py [--input str] [--output str] [--tran_prob str] [--quiet]
+#   generate_union_kindle_jaen.py [--input str] [--output str] [--tran_prob str] [--workers num]
+#     [--quiet]
 #
 # Example:
 #   ./generate_union_kindle_jaen.py --input union-body.tkh --output union-dict-epub
@@ -19,13 +20,16 @@
 # and limitations under the License.
 #--------------------------------------------------------------------------------------------------
 
+import array
 import collections
 import copy
 import datetime
 import html
-import json
+import itertools
 import logging
 import math
+import multiprocessing
+import operator
 import os
 import pathlib
 import regex
@@ -152,35 +156,52 @@ KANA_CONVERSION_MAP = {
   "ゃ": ("や", 4), "ゅ": ("ゆ", 4), "ょ": ("よ", 4), "ゕ": ("か", 4), "ゖ": ("け", 4),
   "ゔ": ("う", 6),
 }
+SAHEN_VERB_SUFFIXES = ("する", "した", "される", "された")
+ADJV_NOUN_SUFFIXES = ("な", "に", "と")
+MEMO_CACHE_CAPACITY = 500000
+INPUT_BUFFER_SIZE = 1 << 20
+MAIN_PAGE_BUFFER_SIZE = 1 << 20
+READ_BATCH_SIZE = 1000
 
 
+class _YomiPriorityTable(dict):
+  def __missing__(self, key):
+    self[key] = "5"
+    return "5"
+
+
+_yomi_norm_table = {ord(char): conv[0] for char, conv in KANA_CONVERSION_MAP.items()}
+_yomi_priority_table = _YomiPriorityTable(
+  (ord(char), str(conv[1])) for char, conv in KANA_CONVERSION_MAP.items())
+_yomi_priority_table[ord("ー")] = "3"
+_yomi_long_vowel_map = {
+  char: group[0] for group in (
+    "あかさたなはまやらわ", "いきしちにひみりゐ", "うくすつぬふむゆる",
+    "えけせてねへめれゑ", "おこそとのほもよろを", "ん")
+  for char in group}
 def MakeYomiKey(yomi):
-  norm_chars = []
-  priorities = []
-  last_norm_char = ""
-  for char in yomi:
-    priority = 5
-    if char == "ー":
-      if last_norm_char in "あかさたなはまやらわ":
-        norm_char, priority = ("あ", 3)
-      elif last_norm_char in "いきしちにひみりゐ":
-        norm_char, priority = ("い", 3)
-      elif last_norm_char in "うくすつぬふむゆる":
-        norm_char, priority = ("う", 3)
-      elif last_norm_char in "えけせてねへめれゑ":
-        norm_char, priority = ("え", 3)
-      elif last_norm_char in "おこそとのほもよろを":
-        norm_char, priority = ("お", 3)
-      elif last_norm_char in "ん":
-        norm_char, priority = ("ん", 3)
-      else:
-        norm_char, priority = (char, 3)
-    else:
-      norm_char, priority = KANA_CONVERSION_MAP.get(char) or (char, 5)
-    norm_chars.append(norm_char)
-    priorities.append(str(priority))
-    last_norm_char = norm_char[0]
-  return "".join(norm_chars) + "\0" + "".join(priorities)
+  norm_yomi = yomi.translate(_yomi_norm_table)
+  if "ー" in norm_yomi:
+    norm_chars = list(norm_yomi)
+    last_norm_char = "あ"
+    for i, char in enumerate(norm_chars):
+      if char == "ー":
+        char = _yomi_long_vowel_map.get(last_norm_char, char)
+        norm_chars[i] = char
+      last_norm_char = char
+    norm_yomi = "".join(norm_chars)
+  return norm_yomi + "\0" + yomi.translate(_yomi_priority_table)
+
+
+def IsAcceptableTran(rank, tran_prob, is_phrase, in_dict, hit_aux):
+  if rank == 0 and not is_phrase:
+    return True
+  if ((rank <= 1 and tran_prob >= 0.01) or (rank <= 2 and tran_prob >= 0.02) or
+      (rank <= 3 and tran_prob >= 0.04) or tran_prob >= 0.1):
+    return True
+  if is_phrase:
+    return tran_prob >= 0.01 and hit_aux
+  return in_dict and (rank <= 1 or hit_aux)
 
 
 def esc(expr):
@@ -189,11 +210,95 @@ def esc(expr):
   return html.escape(str(expr), True)
 
 
+_regex_middle_dots = regex.compile(r"[・]")
+_regex_paren_expr = regex.compile(r"\(.*?\)")
+_regex_han_katakana_head = regex.compile(r"^[\p{Han}\p{Katakana}]")
+_regex_han_katakana = regex.compile(r"[\p{Han}\p{Katakana}]")
+_regex_verb_suffix = regex.compile(
+  r"^(.{2,})(する|した|して|している|される|された|されて|されている)$")
+_regex_wordnet_attr = regex.compile(r"^\[(\w+)\]: (.*)")
+_regex_han_particle_suffix = regex.compile(
+  r"^([\p{Han}]{2,})(する|して|される|されて|にする|できる|できない|のない"
+  r"を|に|が|へ|や|の|と|から|で|より|な)$")
+_regex_hiragana_only = regex.compile(r"[\p{Hiragana}ー]+")
+_extra_token_penalties = tuple(0.3 ** i for i in range(64))
+_hiragana_chars = "".join(chr(c) for c in range(0x3041, 0x3097)) + "ゝゞゟー"
+_regex_hiragana_head = regex.compile(r"^[\p{Hiragana}]")
+_regex_hiragana = regex.compile(r"\p{Hiragana}")
+_regex_han = regex.compile(r"\p{Han}")
+_empty_synsets = ()
+
+
+class WordBucket:
+  __slots__ = ("words", "scores", "probs", "synsets")
+
+  def __init__(self):
+    self.words = []
+    self.scores = array.array("d")
+    self.probs = array.array("d")
+    self.synsets = []
+
+  def __len__(self):
+    return len(self.words)
+
+  def __iter__(self):
+    return zip(self.words, self.scores, self.probs, self.synsets)
+
+  def Append(self, word, score, prob, synsets):
+    self.words.append(word)
+    self.scores.append(score)
+    self.probs.append(prob)
+    self.synsets.append(synsets)
+
+  def Extend(self, items):
+    if isinstance(items, WordBucket):
+      self.words.extend(items.words)
+      self.scores.extend(items.scores)
+      self.probs.extend(items.probs)
+      self.synsets.extend(items.synsets)
+    else:
+      for word, score, prob, synsets in items:
+        self.Append(word, score, prob, synsets)
+
+
+_read_entries_context = None
+def InitReadEntriesWorker():
+  global _read_entries_context
+  batch, aux_trans = _read_entries_context
+  tran_prob_dbm = None
+  if batch.tran_prob_path:
+    tran_prob_dbm = tkrzw.DBM()
+    tran_prob_dbm.Open(batch.tran_prob_path, False, dbm="HashDBM").OrDie()
+  _read_entries_context = (batch, tran_prob_dbm, aux_trans)
+
+
+def ReadEntriesInWorker(records):
+  batch, tran_prob_dbm, aux_trans = _read_entries_context
+  word_dict = collections.defaultdict(WordBucket)
+  batch.ReadEntryRecords(word_dict, records, tran_prob_dbm, aux_trans)
+  return word_dict
+
+
+_main_page_context = None
+def MakeMainPageInWorker(page_id):
+  batch, yomi_dict, conj_verbs, conj_adjs = _main_page_context
+  first, items = yomi_dict[page_id - 1]
+  batch.ResetStats()
+  rev_prob_dbm = None
+  if batch.rev_prob_path:
+    rev_prob_dbm = tkrzw.DBM()
+    rev_prob_dbm.Open(batch.rev_prob_path, False, dbm="HashDBM").OrDie()
+  batch.MakeMainPage(page_id, first, items, conj_verbs, conj_adjs, rev_prob_dbm)
+  if rev_prob_dbm:
+    rev_prob_dbm.Close().OrDie()
+  return batch.GetStats()
+
+
 class GenerateUnionEPUBBatch:
   def __init__(self, input_path, output_path, supplement_labels,
                tran_prob_path, phrase_prob_path, rev_prob_path,
                yomi_paths, tran_aux_paths, rev_tran_aux_paths,
-               conj_verb_path, conj_adj_path, title):
+               conj_verb_path, conj_adj_path, title, num_workers):
     self.input_path = input_path
     self.output_path = output_path
     self.supplement_labels = supplement_labels
@@ -206,10 +311,29 @@ class GenerateUnionEPUBBatch:
     self.conj_verb_path = conj_verb_path
     self.conj_adj_path = conj_adj_path
     self.title = title
+    self.num_workers = num_workers
     self.tokenizer = tkrzw_tokenizer.Tokenizer()
+    self.ResetStats()
+    self.strip_cache = {}
+    self.norm_cache = {}
+    self.yomi_cache = {}
+    self.last_pos_cache = {}
+    self.sahen_noun_cache = {}
+    self.adjv_noun_cache = {}
+    self.phrase_prob_cache = {}
+    self.tran_prob_cache = {}
+
+  def ResetStats(self):
     self.num_words = 0
     self.num_items = 0
 
+  def GetStats(self):
+    return (self.num_words, self.num_items)
+
+  def AddStats(self, stats):
+    self.num_words += stats[0]
+    self.num_items += stats[1]
+
   def Run(self):
     start_time = time.time()
     logger.info("Process started: input_path={}, output_path={}".format(
@@ -231,6 +355,7 @@ class GenerateUnionEPUBBatch:
     os.makedirs(self.output_path, exist_ok=True)
     aux_trans = self.ReadAuxTrans(self.tran_aux_paths)
     rev_aux_trans = self.ReadAuxTrans(self.rev_tran_aux_paths)
+    inv_aux_trans = self.InvertAuxTrans(aux_trans)
     conj_verbs = self.ReadConjWords(self.conj_verb_path)
     conj_adjs = self.ReadConjWords(self.conj_adj_path)
     word_dict = self.ReadEntries(input_dbm, tran_prob_dbm, aux_trans)
@@ -241,7 +366,7 @@ class GenerateUnionEPUBBatch:
       if not yomi_path: continue
       self.ReadYomiMap(yomi_path, yomi_map, keywords, dubious_yomi_map)
     self.AddAuxTrans(word_dict, tran_prob_dbm, aux_trans)
-    self.AddKeywords(word_dict, keywords, aux_trans, rev_aux_trans)
+    self.AddKeywords(word_dict, keywords, inv_aux_trans, rev_aux_trans)
     if phrase_prob_dbm and rev_prob_dbm:
       word_dict = self.FilterEntries(word_dict, phrase_prob_dbm, rev_prob_dbm, keywords)
     input_dbm.Close().OrDie()
@@ -259,11 +384,38 @@ class GenerateUnionEPUBBatch:
       tran_prob_dbm.Close().OrDie()
     logger.info("Process done: elapsed_time={:.2f}s".format(time.time() - start_time))
 
+  def CallWithMemo(self, cache, func, arg):
+    result = cache.get(arg)
+    if result is None:
+      if len(cache) >= MEMO_CACHE_CAPACITY:
+        cache.clear()
+      result = func(arg)
+      cache[arg] = result
+    return result
+
+  def StripJaParticles(self, word):
+    return self.CallWithMemo(self.strip_cache, self.tokenizer.StripJaParticles, word)
+
+  def NormalizeWord(self, word):
+    return self.CallWithMemo(self.norm_cache, tkrzw_dict.NormalizeWord, word)
+
+  def GetJaYomi(self, word):
+    return self.CallWithMemo(self.yomi_cache, self.tokenizer.GetJaYomi, word)
+
+  def GetJaLastPos(self, word):
+    return self.CallWithMemo(self.last_pos_cache, self.tokenizer.GetJaLastPos, word)
+
+  def IsJaWordSahenNoun(self, word):
+    return self.CallWithMemo(self.sahen_noun_cache, self.tokenizer.IsJaWordSahenNoun, word)
+
+  def IsJaWordAdjvNoun(self, word):
+    return self.CallWithMemo(self.adjv_noun_cache, self.tokenizer.IsJaWordAdjvNoun, word)
+
   def ReadAuxTrans(self, paths):
     aux_trans = collections.defaultdict(list)
     for path in paths:
       if not path: continue
-      with open(path) as input_file:
+      with open(path, buffering=INPUT_BUFFER_SIZE) as input_file:
         for line in input_file:
           fields = line.strip().split("\t")
           if len(fields) <= 2: continue
@@ -274,7 +426,7 @@ class GenerateUnionEPUBBatch:
   def ReadConjWords(self, path):
     conjs = {}
     if path:
-      with open(path) as input_file:
+      with open(path, buffering=INPUT_BUFFER_SIZE) as input_file:
         for line in input_file:
           fields = line.strip().split("\t")
           if len(fields) <= 2: continue
@@ -284,27 +436,62 @@ class GenerateUnionEPUBBatch:
 
   def ReadEntries(self, input_dbm, tran_prob_dbm, aux_trans):
     logger.info("Reading entries: start")
-    word_dict = collections.defaultdict(list)
+    word_dict = collections.defaultdict(WordBucket)
+    batches = self.IterateEntryRecords(input_dbm)
+    if self.num_workers <= 1:
+      for records in batches:
+        self.ReadEntryRecords(word_dict, records, tran_prob_dbm, aux_trans)
+    else:
+      global _read_entries_context
+      _read_entries_context = (self, aux_trans)
+      with multiprocessing.get_context("fork").Pool(
+          self.num_workers, InitReadEntriesWorker) as pool:
+        pending = collections.deque()
+        for records in batches:
+          pending.append(pool.apply_async(ReadEntriesInWorker, (records,)))
+          while len(pending) > self.num_workers * 2 or (pending and pending[0].ready()):
+            self.MergeWordDict(word_dict, pending.popleft().get())
+        while pending:
+          self.MergeWordDict(word_dict, pending.popleft().get())
+      _read_entries_context = None
+    logger.info("Reading entries: done: {}".format(len(word_dict)))
+    return word_dict
+
+  def MergeWordDict(self, word_dict, part):
+    for tran, items in part.items():
+      bucket = word_dict.get(tran)
+      if bucket is None:
+        word_dict[tran] = items
+      else:
+        bucket.Extend(items)
+
+  def IterateEntryRecords(self, input_dbm):
     it = input_dbm.MakeIterator()
     it.First()
     num_entries = 0
+    records = []
     while True:
-      record = it.GetStr()
+      record = it.Step()
       if not record: break
-      key, serialized = record
+      records.append(record[1])
       num_entries += 1
       if num_entries % 10000 == 0:
         logger.info("Reading entries: num_enties={}".format(num_entries))
-      entry = json.loads(serialized)
+      if len(records) >= READ_BATCH_SIZE:
+        yield records
+        records = []
+    if records:
+      yield records
+
+  def ReadEntryRecords(self, word_dict, records, tran_prob_dbm, aux_trans):
+    for serialized in records:
+      entry = tkrzw_dict.LoadJSON(serialized)
       for word_entry in entry:
         self.ReadEntry(word_dict, word_entry, tran_prob_dbm, aux_trans)
-      it.Next()
-    logger.info("Reading entries: done: {}".format(len(word_dict)))
-    return word_dict
 
   def ReadEntry(self, word_dict, entry, tran_prob_dbm, aux_trans):
-    word = entry["word"]
-    norm_word = tkrzw_dict.NormalizeWord(word)
+    word = sys.intern(entry["word"])
+    norm_word = self.NormalizeWord(word)
     word_prob = float(entry.get("probability") or 0)
     trans = entry.get("translation") or []
     word_aux_trans = aux_trans.get(word)
@@ -321,134 +508,72 @@ class GenerateUnionEPUBBatch:
           if tran:
             trans.append(tran)
             dict_trans.add(tran)
-    tran_probs = {}
-    if tran_prob_dbm:
-      tsv = tran_prob_dbm.GetStr(norm_word)
-      if tsv:
-        fields = tsv.split("\t")
-        for i in range(0, len(fields), 3):
-          src, trg, prob = fields[i], fields[i + 1], float(fields[i + 2])
-          if src != word: continue
-          tran_probs[trg] = prob
-    word_prob_score = max(0.1, (word_prob ** 0.5))
-    rank_score = 0.5
     uniq_trans = set()
     norm_trans = []
     for tran in trans:
-      tran = regex.sub("[・]", "", tran).strip()
+      tran = _regex_middle_dots.sub("", tran).strip()
       if tran and tran not in uniq_trans:
         norm_trans.append(tran)
         uniq_trans.add(tran)
+    phrases = entry.get("phrase") or []
+    if not norm_trans and not phrases: return
+    tran_probs = {}
+    if tran_prob_dbm:
+      tran_probs = self.GetTranProbs(tran_prob_dbm, norm_word, word)
+    word_prob_score = max(0.1, (word_prob ** 0.5))
+    rank_score = 0.5
+    wn_synsets = None
     for i, tran in enumerate(norm_trans):
-      if tkrzw_dict.NormalizeWord(tran) == norm_word: continue
+      if self.NormalizeWord(tran) == norm_word: continue
       tran_prob = tran_probs.get(tran) or 0
-      tran_stem, tran_prefix, tran_suffix = self.tokenizer.StripJaParticles(tran)
-      if tran_prefix:
-        new_tran = tran_stem + tran_suffix
-        new_prob = tran_probs.get(new_tran) or 0
-        if (tran_prefix == "を" or regex.search(r"^[\p{Han}\p{Katakana}]", tran_stem) or
-            (new_prob >= 0.01 and new_prob >= tran_prob)):
-          tran = new_tran
-          tran_prob = max(tran_prob, new_prob)
-      match = regex.search(
-        r"^(.{2,})(する|した|して|している|される|された|されて|されている)$", tran)
+      tran, tran_prob = self.StripTranParticles(tran, tran_prob, tran_probs)
+      match = _regex_verb_suffix.search(tran)
       if match:
         new_tran = match.group(1)
         new_prob = tran_probs.get(new_tran) or 0
         if new_prob > tran_prob:
           tran_prob = new_prob
       hit_aux_tran = word_aux_trans and tran in word_aux_trans
-      if i == 0:
-        pass
-      elif i <= 1 and tran_prob >= 0.01:
-        pass
-      elif i <= 2 and tran_prob >= 0.02:
-        pass
-      elif i <= 3 and tran_prob >= 0.04:
-        pass
-      elif tran_prob >= 0.1:
-        pass
-      elif tran in dict_trans and (i <= 1 or hit_aux_tran):
-        pass
-      else:
-        continue
+      if not IsAcceptableTran(i, tran_prob, False, tran in dict_trans, hit_aux_tran): continue
       tran_prob_score = tran_prob ** 0.75
       dict_score = 0.1 if tran in dict_trans else 0.0
       if hit_aux_tran: dict_score += 0.1
-      synsets = []
-      for item in entry["item"]:
-        if item["label"] != "wn": continue
-        texts = item["text"].split(" [-] ")
-        synset_id = ""
-        gloss = texts[0]
-        synonyms = []
-        tran_match = False
-        for text in texts[1:]:
-          match = regex.search(r"^\[(\w+)\]: (.*)", text)
-          if not match: continue
-          name = match.group(1).strip()
-          text = match.group(2).strip()
-          if name == "synset":
-            synset_id = text
-          elif name == "synonym":
-            for synonym in text.split(","):
-              synonym = synonym.strip()
-              if synonym:
-                synonyms.append(synonym)
-          elif name == "translation":
-            for syn_tran in text.split(","):
-              syn_tran = syn_tran.strip()
-              if syn_tran == tran:
-                tran_match = True
-        if synset_id and tran_match:
-          synsets.append((synset_id, gloss, synonyms))
+      if wn_synsets is None:
+        wn_synsets = self.ParseWordNetItems(entry["item"])
+      synsets = tuple(synset for synset, syn_trans in wn_synsets if tran in syn_trans)
       if synsets:
         dict_score += 0.1
       score = word_prob_score + rank_score + tran_prob_score + dict_score
-      word_dict[tran].append((word, score, tran_prob, synsets))
+      word_dict[tran].Append(word, score, tran_prob, synsets)
       rank_score *= 0.8
-    phrases = entry.get("phrase") or []
     for phrase in phrases:
       phrase_word = phrase.get("w")
       phrase_prob = float(phrase.get("p") or 0)
       if not phrase_word: continue
       if phrase_prob < 0.005 and not phrase.get("i"): continue
       score = word_prob_score + rank_score
-      norm_phrase_word = tkrzw_dict.NormalizeWord(phrase_word)
+      norm_phrase_word = self.NormalizeWord(phrase_word)
       phrase_trans = phrase.get("x") or []
       phrase_aux_trans = aux_trans.get(phrase_word)
       if phrase_aux_trans:
         phrase_aux_trans = set(phrase_aux_trans)
         phrase_trans.extend(phrase_aux_trans)
-      phrase_tran_probs = {}
-      if tran_prob_dbm:
-        tsv = tran_prob_dbm.GetStr(norm_phrase_word)
-        if tsv:
-          fields = tsv.split("\t")
-          for i in range(0, len(fields), 3):
-            src, trg, prob = fields[i], fields[i + 1], float(fields[i + 2])
-            if src != norm_phrase_word: continue
-            phrase_tran_probs[trg] = prob
       norm_phrase_trans = []
       for phrase_tran in phrase.get("x"):
-        phrase_tran = regex.sub(r"\(.*?\)", "", phrase_tran).strip()
-        phrase_tran = regex.sub("[・]", "", phrase_tran).strip()
+        phrase_tran = _regex_paren_expr.sub("", phrase_tran).strip()
+        phrase_tran = _regex_middle_dots.sub("", phrase_tran).strip()
         if phrase_tran and phrase_tran not in uniq_trans:
           norm_phrase_trans.append(phrase_tran)
           uniq_trans.add(phrase_tran)
+      if not norm_phrase_trans: continue
+      phrase_tran_probs = {}
+      if tran_prob_dbm:
+        phrase_tran_probs = self.GetTranProbs(tran_prob_dbm, norm_phrase_word, norm_phrase_word)
       for i, tran in enumerate(norm_phrase_trans):
-        if tkrzw_dict.NormalizeWord(tran) == norm_word: continue
+        if self.NormalizeWord(tran) == norm_word: continue
         tran_prob = phrase_tran_probs.get(tran) or 0
-        tran_stem, tran_prefix, tran_suffix = self.tokenizer.StripJaParticles(tran)
-        if tran_prefix:
-          new_tran = tran_stem + tran_suffix
-          new_prob = tran_probs.get(new_tran) or 0
-          if (tran_prefix == "を" or regex.search(r"^[\p{Han}\p{Katakana}]", tran_stem) or
-              (new_prob >= 0.01 and new_prob >= tran_prob)):
-            tran = new_tran
-            tran_prob = max(tran_prob, new_prob)
-        match = regex.search(
-          r"^(.{2,})(する|した|して|している|される|された|されて|されている)$", tran)
+        tran, tran_prob = self.StripTranParticles(tran, tran_prob, tran_probs)
+        match = _regex_verb_suffix.search(tran)
         if match:
           new_tran = match.group(1)
           new_prob = phrase_tran_probs.get(new_tran) or 0
@@ -456,80 +581,116 @@ class GenerateUnionEPUBBatch:
             tran = new_tran
             tran_prob = new_prob
         hit_aux_tran = phrase_aux_trans and tran in phrase_aux_trans
-        if i <= 1 and tran_prob >= 0.01:
-          pass
-        elif i <= 2 and tran_prob >= 0.02:
-          pass
-        elif i <= 3 and tran_prob >= 0.04:
-          pass
-        elif tran_prob >= 0.1:
-          pass
-        elif tran_prob >= 0.01 and hit_aux_tran:
-          pass
-        else:
-          continue
+        if not IsAcceptableTran(i, tran_prob, True, tran in dict_trans, hit_aux_tran): continue
         tran_prob_score = tran_prob ** 0.75
         dict_score = 0.1 if tran in dict_trans else 0.0
         if hit_aux_tran: dict_score += 0.1
         score = word_prob_score + rank_score + tran_prob_score + dict_score
-        word_dict[tran].append((phrase_word, score, tran_prob, []))
+        word_dict[tran].Append(phrase_word, score, tran_prob, _empty_synsets)
         rank_score *= 0.95
 
+  def ParseWordNetItems(self, items):
+    wn_synsets = []
+    for item in items:
+      if item["label"] != "wn": continue
+      texts = item["text"].split(" [-] ")
+      synset_id = ""
+      gloss = texts[0]
+      synonyms = []
+      syn_trans = set()
+      for text in texts[1:]:
+        if not text.startswith("["): continue
+        match = _regex_wordnet_attr.match(text)
+        if not match: continue
+        name = match.group(1).strip()
+        text = match.group(2).strip()
+        if name == "synset":
+          synset_id = text
+        elif name == "synonym":
+          for synonym in text.split(","):
+            synonym = synonym.strip()
+            if synonym:
+              synonyms.append(synonym)
+        elif name == "translation":
+          for syn_tran in text.split(","):
+            syn_trans.add(syn_tran.strip())
+      if synset_id:
+        wn_synsets.append(((synset_id, gloss, tuple(synonyms)), syn_trans))
+    return wn_synsets
+
+  def GetTranProbs(self, tran_prob_dbm, key, src_word):
+    cache_key = (key, src_word)
+    tran_probs = self.tran_prob_cache.get(cache_key)
+    if tran_probs is None:
+      if len(self.tran_prob_cache) >= MEMO_CACHE_CAPACITY:
+        self.tran_prob_cache.clear()
+      tran_probs = {}
+      tsv = tran_prob_dbm.GetStr(key)
+      if tsv:
+        fields = tsv.split("\t")
+        for src, trg, prob in zip(fields[0::3], fields[1::3], fields[2::3]):
+          if src != src_word: continue
+          tran_probs[trg] = float(prob)
+      self.tran_prob_cache[cache_key] = tran_probs
+    return tran_probs
+
+  def StripTranParticles(self, tran, tran_prob, tran_probs):
+    tran_stem, tran_prefix, tran_suffix = self.StripJaParticles(tran)
+    if tran_prefix:
+      new_tran = tran_stem + tran_suffix
+      new_prob = tran_probs.get(new_tran) or 0
+      if (tran_prefix == "を" or _regex_han_katakana_head.search(tran_stem) or
+          (new_prob >= 0.01 and new_prob >= tran_prob)):
+        tran = new_tran
+        tran_prob = max(tran_prob, new_prob)
+    return tran, tran_prob
+
   def AddAuxTrans(self, word_dict, tran_prob_dbm, aux_trans):
     if not tran_prob_dbm: return
     logger.info("Adding from auxiliary translations")
     count_added = 0
     for word, trans in aux_trans.items():
-      norm_word = tkrzw_dict.NormalizeWord(word)
+      norm_word = self.NormalizeWord(word)
+      tran_probs = self.GetTranProbs(tran_prob_dbm, norm_word, word)
+      if not tran_probs: continue
       trans = set(trans)
-      tsv = tran_prob_dbm.GetStr(norm_word)
-      if not tsv: continue
-      tran_probs = {}
-      fields = tsv.split("\t")
-      for i in range(0, len(fields), 3):
-        src, trg, prob = fields[i], fields[i + 1], float(fields[i + 2])
-        if src != word: continue
-        tran_probs[trg] = prob
       for tran, tran_prob in tran_probs.items():
         if tran_prob < 0.1: continue
         if tran not in trans: continue
-        if tkrzw_dict.NormalizeWord(tran) == norm_word: continue
-        tran_stem, tran_prefix, tran_suffix = self.tokenizer.StripJaParticles(tran)
-        if tran_prefix:
-          new_tran = tran_stem + tran_suffix
-          new_prob = tran_probs.get(new_tran) or 0
-          if (tran_prefix == "を" or regex.search(r"^[\p{Han}\p{Katakana}]", tran_stem) or
-              (new_prob >= 0.01 and new_prob >= tran_prob)):
-            tran = new_tran
-            tran_prob = max(tran_prob, new_prob)
+        if self.NormalizeWord(tran) == norm_word: continue
+        tran, tran_prob = self.StripTranParticles(tran, tran_prob, tran_probs)
         score = tran_prob ** 0.5
-        word_dict[tran].append((word, score, tran_prob, []))
+        word_dict[tran].Append(word, score, tran_prob, _empty_synsets)
         count_added += 1
     logger.info("Adding from auxiliary translations: done: {}".format(count_added))
 
-  def AddKeywords(self, word_dict, keywords, aux_trans, rev_aux_trans):
-    logger.info("Adding from keywords")
-    count_added = 0
+  def InvertAuxTrans(self, aux_trans):
     inv_aux_trans = collections.defaultdict(list)
     for word, trans in aux_trans.items():
       for tran in trans:
         inv_aux_trans[tran].append(word)
+    return inv_aux_trans
+
+  def AddKeywords(self, word_dict, keywords, inv_aux_trans, rev_aux_trans):
+    logger.info("Adding from keywords")
+    count_added = 0
     for tran, count in keywords.items():
       if count < 3: continue
       if tran in word_dict: continue
-      words = inv_aux_trans.get(tran) or []
-      words.extend(rev_aux_trans.get(tran) or [])
+      words = (inv_aux_trans.get(tran) or []) + (rev_aux_trans.get(tran) or [])
       base_score = 1.0
       if words:
+        bucket = WordBucket()
         for word in words[:2]:
-          word_dict[tran].append((word, count * base_score * 0.01, 0.01, []))
+          bucket.Append(word, count * base_score * 0.01, 0.01, _empty_synsets)
           base_score *= 0.8
+        word_dict[tran] = bucket
         count_added += 1
     logger.info("Adding from keywords: done: {}".format(count_added))
 
   def FilterEntries(self, word_dict, phrase_prob_dbm, rev_prob_dbm, keywords):
     logger.info("Filtering entries: before={}".format(len(word_dict)))
-    new_word_dict1 = collections.defaultdict(list)
+    new_word_dict1 = collections.defaultdict(WordBucket)
     num_entries = 0
     count_ok_keyword = 0
     count_ok_tran_only = 0
@@ -537,17 +698,19 @@ class GenerateUnionEPUBBatch:
     count_ok_word_tran = 0
     count_ok_phrase_tran = 0
     count_ng = 0
+    phrase_prob_cache = {}
+    rev_prob_cache = {}
     for word, items in word_dict.items():
       num_entries += 1
       if num_entries % 10000 == 0:
         logger.info("Filtering entries R1: num_enties={}".format(num_entries))
-      word_prob = self.GetPhraseProb(rev_prob_dbm, "ja", word)
+      word_prob = self.GetPhraseProb(rev_prob_dbm, "ja", word, rev_prob_cache)
       max_tran_prob = 0
       max_phrase_prob = 0
       new_items = []
       for tran, score, tran_prob, synsets in items:
         max_tran_prob = max(max_tran_prob, tran_prob)
-        phrase_prob = self.GetPhraseProb(phrase_prob_dbm, "en", tran)
+        phrase_prob = self.GetPhraseProb(phrase_prob_dbm, "en", tran, phrase_prob_cache)
         max_phrase_prob = max(max_phrase_prob, phrase_prob)
         score += min(0.2, phrase_prob ** 0.33)
         new_items.append((tran, score, tran_prob, synsets))
@@ -564,43 +727,42 @@ class GenerateUnionEPUBBatch:
       else:
         count_ng += 1
         continue
-      new_word_dict1[word].extend(new_items)
+      new_word_dict1[word].Extend(new_items)
     logger.info("Filtering entries R1 done: "
                 "after={}, k={}, t={}, w={}, wt={}, pt={}, ng={}".format(
                   len(new_word_dict1), count_ok_keyword, count_ok_tran_only, count_ok_word_only,
                   count_ok_word_tran, count_ok_phrase_tran, count_ng))
-    new_word_dict2 = collections.defaultdict(list)
-    count_dup_affix = 0
+    dup_affix_words = []
     for word, items in new_word_dict1.items():
       num_entries += 1
       if num_entries % 10000 == 0:
         logger.info("Filtering entries R2: num_enties={}".format(num_entries))
       stems = set()
-      stem, prefix, suffix = self.tokenizer.StripJaParticles(word)
+      stem, prefix, suffix = self.StripJaParticles(word)
       if stem != word:
         stems.add(stem)
-      match = regex.search(
-        r"^(.{2,})(する|した|して|している|される|された|されて|されている)$", word)
+      match = _regex_verb_suffix.search(word)
       if match:
         stems.add(match.group(1))
       stem_trans = set()
       for stem in stems:
         stem_items = new_word_dict1.get(stem)
         if stem_items:
-          for stem_tran, _, _, _ in stem_items:
+          for stem_tran in stem_items.words:
             stem_trans.add(stem_tran.lower())
       if stem_trans:
         has_unique = False
-        for tran, _, _, _ in items:
+        for tran in items.words:
           if tran.lower() not in stem_trans:
             has_unique = True
+            break
         if not has_unique:
-          count_dup_affix += 1
-          continue
-      new_word_dict2[word].extend(items)
+          dup_affix_words.append(word)
+    for word in dup_affix_words:
+      del new_word_dict1[word]
     logger.info("Filtering entries R2 done: after={}, da={}".format(
-      len(new_word_dict2), count_dup_affix))
-    return new_word_dict2
+      len(new_word_dict1), len(dup_affix_words)))
+    return new_word_dict1
 
   def MakeYomiDict(self, word_dict, yomi_map, dubious_yomi_map):
     yomi_dict = collections.defaultdict(list)
@@ -616,15 +778,13 @@ class GenerateUnionEPUBBatch:
           word_yomi = self.ChooseBestYomi(word, part_yomis, False)
       if not word_yomi:
         trg_word = word
-        stem, prefix, suffix = self.tokenizer.StripJaParticles(word)
+        stem, prefix, suffix = self.StripJaParticles(word)
         if stem != word:
           part_yomis = yomi_map.get(stem)
           if part_yomis:
             part_yomis = [prefix + x + suffix for x in part_yomis]
             trg_word = self.ChooseBestYomi(word, part_yomis, True)
-        match = regex.search(
-          "^([\p{Han}]{2,})(する|して|される|されて|にする|できる|できない|のない"
-          "を|に|が|へ|や|の|と|から|で|より|な)$", word)
+        match = _regex_han_particle_suffix.search(word)
         if match:
           stem = match.group(1)
           suffix = match.group(2)
@@ -634,50 +794,51 @@ class GenerateUnionEPUBBatch:
                              part_yomis[0] not in dubious_part_yomis):
             part_yomis = [prefix + x + suffix for x in part_yomis]
             trg_word = self.ChooseBestYomi(word, part_yomis, True)
-        if dubious_word_yomi and not regex.fullmatch(r"[\p{Hiragana}ー]+", trg_word):
+        if dubious_word_yomi and not _regex_hiragana_only.fullmatch(trg_word):
           word_yomi = dubious_word_yomi
         else:
-          word_yomi = self.tokenizer.GetJaYomi(trg_word)
+          word_yomi = self.GetJaYomi(trg_word)
       if not word_yomi: continue
       word_yomi_key = MakeYomiKey(word_yomi)
       first = word_yomi_key[0]
-      if regex.search(r"^[\p{Hiragana}]", first):
+      if _regex_hiragana_head.search(first):
         yomi_dict[first].append((word_yomi_key, word_yomi, word, items))
       else:
         yomi_dict["他"].append((word_yomi_key, word_yomi, word, items))
     sorted_yomi_dict = []
     for first, items in sorted(yomi_dict.items()):
-      items = sorted(items)
+      items.sort()
       dedup_items = []
-      i = 0
-      while i < len(items):
-        _, word_yomi, word, yomi_items = items[i]
-        if regex.search(r"\p{Hiragana}", word) and not regex.search(r"\p{Han}", word):
-          uniq_items = []
-          for yomi_item in yomi_items:
-            is_dup = False
-            j = i + 1
-            while j < len(items):
-              _, next_word_yomi, next_word, next_yomi_items = items[j]
-              if next_word_yomi != word_yomi: break
-              for next_yomi_item in next_yomi_items:
-                if yomi_item[0] == next_yomi_item[0]:
+      for word_yomi, group in itertools.groupby(items, key=operator.itemgetter(1)):
+        group_items = []
+        later_trans = set()
+        later_synset_ids = set()
+        later_synonyms = set()
+        for _, _, word, yomi_items in reversed(list(group)):
+          orig_yomi_items = yomi_items
+          if _regex_hiragana.search(word) and not _regex_han.search(word):
+            uniq_items = []
+            for yomi_item in yomi_items:
+              tran, synsets = yomi_item[0], yomi_item[3]
+              if tran in later_trans: continue
+              if synsets and tran in later_synonyms: continue
+              is_dup = False
+              for synset in synsets:
+                if synset[0] in later_synset_ids or not later_trans.isdisjoint(synset[2]):
                   is_dup = True
-                for yomi_item_synset in yomi_item[3]:
-                  for next_yomi_item_synset in next_yomi_item[3]:
-                    if yomi_item_synset[0] == next_yomi_item_synset[0]:
-                      is_dup = True
-                    if yomi_item[0] in next_yomi_item_synset[2]:
-                      is_dup = True
-                  if next_yomi_item[0] in yomi_item_synset[2]:
-                    is_dup = True
-              j += 1
-            if not is_dup:
-              uniq_items.append(yomi_item)
-          yomi_items = uniq_items
-        if yomi_items:
-          dedup_items.append((word_yomi, word, yomi_items))
-        i += 1
+                  break
+              if not is_dup:
+                uniq_items.append(yomi_item)
+            yomi_items = uniq_items
+          if yomi_items:
+            group_items.append((word_yomi, word, yomi_items))
+          for tran, _, _, synsets in orig_yomi_items:
+            later_trans.add(tran)
+            for synset in synsets:
+              later_synset_ids.add(synset[0])
+              later_synonyms.update(synset[2])
+        group_items.reverse()
+        dedup_items.extend(group_items)
       sorted_yomi_dict.append((first, dedup_items))
     return sorted_yomi_dict
 
@@ -690,14 +851,15 @@ class GenerateUnionEPUBBatch:
     if path.startswith("-"):
       path = path[1:]
       is_dubious = True
-    with open(path) as input_file:
+    with open(path, buffering=INPUT_BUFFER_SIZE) as input_file:
       for line in input_file:
         fields = line.strip().split("\t")
         if len(fields) < 2: continue
         kanji = fields[0]
         yomis = []
         for yomi in fields[1:]:
-          if not regex.fullmatch(r"[\p{Hiragana}ー]+", yomi) or len(yomi) > 30: continue
+          if not yomi or len(yomi) > 30: continue
+          if yomi.strip(_hiragana_chars) and not _regex_hiragana_only.fullmatch(yomi): continue
           yomis.append(yomi)
           if is_dubious: break
         yomi_map[kanji].extend(yomis)
@@ -709,7 +871,7 @@ class GenerateUnionEPUBBatch:
   def ChooseBestYomi(self, word, yomis, sort_by_length):
     if len(yomis) == 1:
       return yomis[0]
-    yomis = yomis + [self.tokenizer.GetJaYomi(word)]
+    yomis = yomis + [self.GetJaYomi(word)]
     counts = {}
     i = 0
     while i < len(yomis):
@@ -722,7 +884,17 @@ class GenerateUnionEPUBBatch:
     counts = sorted(counts.items(), key=lambda x: (x[1][0], -x[1][-1]), reverse=True)
     return counts[0][0]
 
-  def GetPhraseProb(self, prob_dbm, language, word):
+  def GetPhraseProb(self, prob_dbm, language, word, cache=None):
+    key = (language, word)
+    prob = self.phrase_prob_cache.get(key)
+    if prob is None:
+      if len(self.phrase_prob_cache) >= MEMO_CACHE_CAPACITY:
+        self.phrase_prob_cache.clear()
+      prob = self.ComputePhraseProb(prob_dbm, language, word, cache)
+      self.phrase_prob_cache[key] = prob
+    return prob
+
+  def ComputePhraseProb(self, prob_dbm, language, word, cache):
     base_prob = 0.000000001
     tokens = self.tokenizer.Tokenize(language, word, False, True)
     if not tokens: return base_prob
@@ -731,59 +903,80 @@ class GenerateUnionEPUBBatch:
     for ngram in range(max_ngram, 0, -1):
       if len(tokens) <= ngram:
         cur_phrase = " ".join(tokens)
-        prob = float(prob_dbm.GetStr(cur_phrase) or 0.0)
+        prob = self.GetNGramProb(prob_dbm, cur_phrase, cache)
         if prob:
           return max(prob, base_prob)
         fallback_penalty *= 0.1
       else:
-        probs = []
-        index = 0
-        miss = False
-        while index <= len(tokens) - ngram:
+        num_phrases = len(tokens) - ngram + 1
+        inv_sum = 0
+        for index in range(num_phrases):
           cur_phrase = " ".join(tokens[index:index + ngram])
-          cur_prob = float(prob_dbm.GetStr(cur_phrase) or 0.0)
-          if not cur_prob:
-            miss = True
-            break
-          probs.append(cur_prob)
-          index += 1
-        if not miss:
-          inv_sum = 0
-          for cur_prob in probs:
-            inv_sum += 1 / cur_prob
-          prob = len(probs) / inv_sum
-          prob *= 0.3 ** (len(tokens) - ngram)
+          cur_prob = self.GetNGramProb(prob_dbm, cur_phrase, cache)
+          if not cur_prob: break
+          inv_sum += 1 / cur_prob
+        else:
+          prob = num_phrases / inv_sum
+          num_extra_tokens = len(tokens) - ngram
+          if num_extra_tokens < len(_extra_token_penalties):
+            prob *= _extra_token_penalties[num_extra_tokens]
+          else:
+            prob *= 0.3 ** num_extra_tokens
           prob *= fallback_penalty
           return max(prob, base_prob)
         fallback_penalty *= 0.1
     return base_prob
 
+  def GetNGramProb(self, prob_dbm, phrase, cache):
+    if cache is None:
+      return float(prob_dbm.GetStr(phrase) or 0.0)
+    prob = cache.get(phrase)
+    if prob is None:
+      if len(cache) >= MEMO_CACHE_CAPACITY:
+        cache.clear()
+      prob = float(prob_dbm.GetStr(phrase) or 0.0)
+      cache[phrase] = prob
+    return prob
+
   def MakeMain(self, yomi_dict, conj_verbs, conj_adjs, rev_prob_dbm):
-    page_id = 0
-    for first, items in yomi_dict:
-      page_id += 1
-      page_path = os.path.join(self.output_path, "main-{:02d}.xhtml".format(page_id))
-      logger.info("Creating: {}".format(page_path))
-      with open(page_path, "w") as out_file:
-        print(MAIN_HEADER_TEXT.format(esc(self.title), esc(first), esc(first)),
-              file=out_file, end="")
-        for item in items:
-          self.MakeMainEntry(out_file, item, conj_verbs, conj_adjs, rev_prob_dbm)
-        print(MAIN_FOOTER_TEXT, file=out_file, end="")
+    num_workers = min(self.num_workers, len(yomi_dict))
+    if num_workers <= 1:
+      for page_id, (first, items) in enumerate(yomi_dict, 1):
+        self.MakeMainPage(page_id, first, items, conj_verbs, conj_adjs, rev_prob_dbm)
+      return
+    page_ids = sorted(range(1, len(yomi_dict) + 1),
+                      key=lambda x: len(yomi_dict[x - 1][1]), reverse=True)
+    global _main_page_context
+    _main_page_context = (self, yomi_dict, conj_verbs, conj_adjs)
+    with multiprocessing.get_context("fork").Pool(num_workers) as pool:
+      for stats in pool.imap_unordered(MakeMainPageInWorker, page_ids):
+        self.AddStats(stats)
+    _main_page_context = None
+
+  def MakeMainPage(self, page_id, first, items, conj_verbs, conj_adjs, rev_prob_dbm):
+    page_path = os.path.join(self.output_path, "main-{:02d}.xhtml".format(page_id))
+    logger.info("Creating: {}".format(page_path))
+    with open(page_path, "wb", buffering=MAIN_PAGE_BUFFER_SIZE) as out_file:
+      out_file.write(MAIN_HEADER_TEXT.format(
+        esc(self.title), esc(first), esc(first)).encode("utf-8"))
+      for item in items:
+        self.MakeMainEntry(out_file, item, conj_verbs, conj_adjs, rev_prob_dbm)
+      out_file.write(MAIN_FOOTER_TEXT.encode("utf-8"))
 
   def MakeMainEntry(self, out_file, entry, conj_verbs, conj_adjs, rev_prob_dbm):
+    parts = []
     def P(*args, end="\n"):
       esc_args = []
       for arg in args[1:]:
         if isinstance(arg, str):
           arg = esc(arg)
         esc_args.append(arg)
-      print(args[0].format(*esc_args), end=end, file=out_file)
+      parts.append(args[0].format(*esc_args))
+      parts.append(end)
     self.num_words += 1
     yomi, word, trans = entry
-    variants = {}
-    variants[yomi] = True
-    pos = self.tokenizer.GetJaLastPos(word)
+    variants = {yomi: True}
+    pos = self.GetJaLastPos(word)
     word_prob = 0
     if rev_prob_dbm:
       word_prob = self.GetPhraseProb(rev_prob_dbm, "ja", word)
@@ -799,32 +992,32 @@ class GenerateUnionEPUBBatch:
         if conjs:
           for conj in sorted(conjs):
             variants[conj] = True
-    stem, prefix, suffix = self.tokenizer.StripJaParticles(word)
+    stem, prefix, suffix = self.StripJaParticles(word)
     if stem != word:
-      if prefix == "を" or regex.search(r"[\p{Han}\p{Katakana}]", stem):
+      if prefix == "を" or _regex_han_katakana.search(stem):
         prefix = ""
       new_word = prefix + stem
       variants[new_word] = True
-    for suffix in ("する", "した", "される", "された"):
-      if word.endswith(suffix):
-        stem = word[:-len(suffix)]
-        if self.tokenizer.IsJaWordSahenNoun(stem):
-          variants[stem] = True
-    for suffix in ("な", "に", "と"):
-      if word.endswith(suffix):
-        stem = word[:-len(suffix)]
-        if self.tokenizer.IsJaWordAdjvNoun(stem):
-          variants[stem] = True
-    if word in variants:
-      del variants[word]
-    trans = sorted(trans, key=lambda x: x[1], reverse=True)
+    if word.endswith(SAHEN_VERB_SUFFIXES):
+      for suffix in SAHEN_VERB_SUFFIXES:
+        if word.endswith(suffix):
+          stem = word[:-len(suffix)]
+          if self.IsJaWordSahenNoun(stem):
+            variants[stem] = True
+          break
+    if word.endswith(ADJV_NOUN_SUFFIXES):
+      stem = word[:-1]
+      if self.IsJaWordAdjvNoun(stem):
+        variants[stem] = True
+    variants.pop(word, None)
+    trans = sorted(trans, key=operator.itemgetter(1), reverse=True)
     P('<idx:entry>')
     P('<div>')
     P('<span class="word">')
     P('<idx:orth>{}', word)
     if variants:
       P('<idx:infl>')
-      for variant, _ in variants.items():
+      for variant in variants:
         P('<idx:iform value="{}"/>', variant)
       P('</idx:infl>')
     P('</idx:orth>')
@@ -836,7 +1029,7 @@ class GenerateUnionEPUBBatch:
     uniq_synsets = set()
     misc_trans = []
     for tran, score, tran_prob, synsets in trans[:8]:
-      norm_tran = tkrzw_dict.NormalizeWord(tran)
+      norm_tran = self.NormalizeWord(tran)
       if norm_tran in uniq_trans: continue
       uniq_trans.add(norm_tran)
       self.num_items += 1
@@ -845,11 +1038,11 @@ class GenerateUnionEPUBBatch:
         if syn_id in uniq_synsets: continue
         uniq_synsets.add(syn_id)
         hit_syn = True
-        P('<div>{}', ", ".join([tran] + syn_words), end="")
+        P('<div>{}', ", ".join((tran,) + syn_words), end="")
         P(' <span class="gloss">- {}</span>', syn_gloss, end="")
         P('</div>')
         for synonym in syn_words:
-          norm_syn = tkrzw_dict.NormalizeWord(synonym)
+          norm_syn = self.NormalizeWord(synonym)
           uniq_trans.add(norm_syn)
       if not hit_syn:
         misc_trans.append(tran)
@@ -857,20 +1050,18 @@ class GenerateUnionEPUBBatch:
       P('<div>{}</div>', ', '.join(misc_trans[:8]))
     P('</idx:entry>')
     P('<br/>')
+    out_file.write("".join(parts).encode("utf-8"))
 
   def MakeNavigation(self, yomi_dict):
     out_path = os.path.join(self.output_path, "nav.xhtml")
     logger.info("Creating: {}".format(out_path))
+    parts = [NAVIGATION_HEADER_TEXT.format(esc(self.title), esc(self.title))]
+    for page_id, (first, items) in enumerate(yomi_dict, 1):
+      page_path = "main-{:02d}.xhtml".format(page_id)
+      parts.append('<li><a href="{}">Words: {}</a></li>\n'.format(esc(page_path), esc(first)))
+    parts.append(NAVIGATION_FOOTER_TEXT)
     with open(out_path, "w") as out_file:
-      print(NAVIGATION_HEADER_TEXT.format(esc(self.title), esc(self.title)),
-            file=out_file, end="")
-      page_id = 0
-      for first, items in yomi_dict:
-        page_id += 1
-        page_path = "main-{:02d}.xhtml".format(page_id)
-        print('<li><a href="{}">Words: {}</a></li>'.format(esc(page_path), esc(first)),
-              file=out_file)
-      print(NAVIGATION_FOOTER_TEXT, file=out_file, end="")
+      out_file.write("".join(parts))
 
   def MakeOverview(self):
     out_path = os.path.join(self.output_path, "overview.xhtml")
@@ -888,19 +1079,15 @@ class GenerateUnionEPUBBatch:
   def MakePackage(self, yomi_dict):
     out_path = os.path.join(self.output_path, "package.opf")
     logger.info("Creating: {}".format(out_path))
+    page_ids = range(1, len(yomi_dict) + 1)
+    parts = [PACKAGE_HEADER_TEXT.format(CURRENT_UUID, esc(self.title), CURRENT_DATETIME)]
+    parts.extend(['<item id="page{:02d}" href="main-{:02d}.xhtml"'
+                  ' media-type="application/xhtml+xml"/>\n'.format(x, x) for x in page_ids])
+    parts.append(PACKAGE_MIDDLE_TEXT)
+    parts.extend(['<itemref idref="page{:02d}"/>\n'.format(x) for x in page_ids])
+    parts.append(PACKAGE_FOOTER_TEXT)
     with open(out_path, "w") as out_file:
-      print(PACKAGE_HEADER_TEXT.format(CURRENT_UUID, esc(self.title), CURRENT_DATETIME),
-            file=out_file, end="")
-      page_id = 0
-      for first, items in yomi_dict:
-        page_id += 1
-        page_path = "main-{:02d}.xhtml".format(page_id)
-        print('<item id="page{:02d}" href="{}" media-type="application/xhtml+xml"/>'.format(
-          page_id, page_path), file=out_file)
-      print(PACKAGE_MIDDLE_TEXT, file=out_file, end="")
-      for i in range(1, page_id + 1):
-        print('<itemref idref="page{:02d}"/>'.format(i), file=out_file)
-      print(PACKAGE_FOOTER_TEXT, file=out_file, end="")
+      out_file.write("".join(parts))
 
 
 def main():
@@ -917,13 +1104,15 @@ def main():
   conj_verb_path = tkrzw_dict.GetCommandFlag(args, "--conj_verb", 1)
   conj_adj_path = tkrzw_dict.GetCommandFlag(args, "--conj_adj", 1)
   title = tkrzw_dict.GetCommandFlag(args, "--title", 1) or "Union Japanese-English Dictionary"
+  num_workers = int(tkrzw_dict.GetCommandFlag(args, "--workers", 1) or os.cpu_count() or 1)
   if not input_path:
     raise RuntimeError("an input path is required")
   if not output_path:
     raise RuntimeError("an output path is required")
   GenerateUnionEPUBBatch(
     input_path, output_path, supplement_labels, tran_prob_path, phrase_prob_path, rev_prob_path,
-    yomi_paths, tran_aux_paths, rev_tran_aux_paths, conj_verb_path, conj_adj_path, title).Run()
+    yomi_paths, tran_aux_paths, rev_tran_aux_paths, conj_verb_path, conj_adj_path, title,
+    num_workers).Run()
 
 
 if __name__=="__main__":
@@ -25,9 +25,9 @@ import collections
 import copy
 import datetime
 import html
-import json
 import logging
 import math
+import operator
 import os
 import pathlib
 import regex
@@ -41,6 +41,8 @@ import uuid
 
 
 logger = tkrzw_dict.GetLogger()
+ENTRY_CACHE_CAPACITY = 100000
+INPUT_BUFFER_SIZE = 1 << 20
 INTRO_TEXT = """* 概要
 {TITLE}は、重要英単語を効率よく覚えるためのWebサイトです。日常でよく使われる重要な英単語{NUM_MAIN_WORDS}語をWebから自動抽出し、意味や用法が似た単語をまとめて覚えることができます。無作為に並べられた英単語を暗記するよりも、周辺の語から連想して記憶する方が、明らかに効率よく学習を進められます。派生語{NUM_DERI_WORDS}語や熟語も含めて総数{NUM_UNIQ_WORDS}語を学習できます。
 * 典型的な使い方
@@ -89,6 +91,11 @@ INFLECTIONS = [
   ("adverb_comparative", "副比"),
   ("adverb_superlative", "副最"),
 ]
+GB_US_SUFFIX_PAIRS = [
+  ("se", "ze"), ("sing", "zing"), ("sed", "zed"),
+  ("ser", "zer"), ("sation", "zation"), ("ence", "ense"),
+  ("our", "or"), ("og", "ogue"), ("re", "er"), ("l", "ll"),
+]
 STYLE_TEXT = """html,body,article,p,pre,code,li,dt,dd,td,th,div { font-size: 12pt; }
 html { margin: 0; padding: 0; background: #eee; }
 body { width: 100%; margin: 0; padding: 0; background: #eee; text-align: center; color: #111; }
@@ -119,7 +126,7 @@ span.auxattr { color: #999; }
 span.metavalue { display: inline-block; margin-right: 0.5ex }
 span.childtrans { font-size: 90%; color: #333; }
 span.subword { font-weight: bold; color: #000; }
-div.control { text-align: right; mergin}
+div.control { text-align: right; margin: 0; }
 div.control span { display: inline-block;
   text-align: center; margin: 0 0.5ex; padding: 0; width: 20ex;
   border: 1px solid #ddd; border-radius: 0.5ex; color: #333; background: #ddd; }
@@ -196,6 +203,15 @@ function change_item(item) {
 }
 """
 
+_regex_katakana = regex.compile(r"([\p{Katakana}][\p{Katakana}ー]*)")
+_regex_han_hiragana = regex.compile(r"[\p{Han}\p{Hiragana}]")
+_regex_japanese = regex.compile(r"[\p{Han}\p{Hiragana}\p{Katakana}]")
+_regex_synonym_attr = regex.compile(r"\[synonym\]: (.*)")
+_regex_example_attr = regex.compile(r"e\.g\.: (.*)")
+_regex_latin_head = regex.compile(r"^[a-zA-Z]")
+_gb_suffixes = tuple(gb_suffix for gb_suffix, _ in GB_US_SUFFIX_PAIRS)
+_inflection_poses = [(name, name[:name.find("_")], label) for name, label in INFLECTIONS]
+
 
 def esc(expr):
   if expr is None:
@@ -204,14 +220,15 @@ def esc(expr):
 
 
 def CutTextByWidth(text, width):
-  result = ""
-  for c in text:
+  if width >= 0 and text.isascii():
+    if len(text) > width + 1:
+      return text[:width + 1] + "..."
+    return text
+  for i, c in enumerate(text):
     if width < 0:
-      result += "..."
-      break
-    result += c
+      return text[:i] + "..."
     width -= 2 if ord(c) > 256 else 1
-  return result
+  return text
 
 
 def ConvertWordToID(word):
@@ -224,19 +241,16 @@ def ConvertWordToID(word):
 def EscapeTranslations(values):
   fields = []
   for value in values:
-    mod_value = regex.sub(
-      r"([\p{Katakana}][\p{Katakana}ー]*)", r'<span class="kk">\1</span>', esc(value))
+    mod_value = _regex_katakana.sub(r'<span class="kk">\1</span>', esc(value))
     fields.append(mod_value)
   return ", ".join(fields)
 
 
 def IsGbAlternative(entry, sibling_alts, body_dbm):
   word = entry["word"]
+  if not word.endswith(_gb_suffixes): return False
   alts = entry.get("alternative") or []
-  suffix_pairs = [("se", "ze"), ("sing", "zing"), ("sed", "zed"),
-                  ("ser", "zer"), ("sation", "zation"), ("ence", "ense"),
-                  ("our", "or"), ("og", "ogue"), ("re", "er"), ("l", "ll")]
-  for gb_suffix, us_suffix in suffix_pairs:
+  for gb_suffix, us_suffix in GB_US_SUFFIX_PAIRS:
     if word.endswith(gb_suffix):
       us_word = word[:-len(gb_suffix)] + us_suffix
       if ((us_word in alts or us_word in sibling_alts)
@@ -256,6 +270,8 @@ class GenerateUnionVocabBatch:
     self.num_section_clusters = num_section_clusters
     self.child_min_prob = child_min_prob
     self.title = title
+    self.entry_cache = {}
+    self.surface_prob_cache = {}
 
   def Run(self):
     clusters = self.ReadClusters()
@@ -295,21 +311,17 @@ class GenerateUnionVocabBatch:
     
   def ReadClusters(self):
     clusters = []
-    with open(self.vocab_path) as input_file:
+    with open(self.vocab_path, buffering=INPUT_BUFFER_SIZE) as input_file:
       for line in input_file:
         fields = line.strip().split("\t")
         if not fields: continue
-        main_words = []
-        extra_words = []
-        is_extra = False
-        for field in fields:
-          if field == "|":
-            is_extra = True
-            continue
-          if is_extra:
-            extra_words.append(field)
-          else:
-            main_words.append(field)
+        if "|" in fields:
+          sep_index = fields.index("|")
+          main_words = fields[:sep_index]
+          extra_words = [x for x in fields[sep_index + 1:] if x != "|"]
+        else:
+          main_words = fields
+          extra_words = []
         clusters.append((main_words, extra_words))
     return clusters
 
@@ -318,20 +330,15 @@ class GenerateUnionVocabBatch:
     for cluster in clusters:
       for word in cluster[0]:
         vetted_words.add(word)
-        data = body_dbm.GetStr(word)
-        if not data: continue
-        entries = json.loads(data)
-        for entry in entries:
+        for entry in self.GetEntries(body_dbm, word):
           if entry["word"] != word: continue
           for label in ("parent", "child"):
             rel_words = entry.get(label)
             if rel_words:
-              for rel_word in rel_words:
-                vetted_words.add(rel_word)
+              vetted_words.update(rel_words)
           phrases = entry.get("phrase")
           if phrases:
-            for phrase in phrases:
-              vetted_words.add(phrase["w"])
+            vetted_words.update(phrase["w"] for phrase in phrases)
     return vetted_words
 
   def PrepareSection(self, clusters, num_sections, has_next,
@@ -341,16 +348,15 @@ class GenerateUnionVocabBatch:
     for cluster in clusters:
       main_words = []
       skipped_words = []
-      dedup_words = []
+      dedup_words = collections.defaultdict(list)
       aliases = collections.defaultdict(set)
       num_words = len(cluster[0])
       local_uniq_words = set()
       for word in cluster[0]:
-        data = body_dbm.GetStr(word)
-        if not data:
+        entries = self.GetEntries(body_dbm, word)
+        if not entries:
           continue
         is_dup = word in uniq_words or word in local_uniq_words
-        entries = json.loads(data)
         for entry in entries:
           if entry["word"] != word: continue
           if is_dup:
@@ -365,14 +371,13 @@ class GenerateUnionVocabBatch:
           children = entry.get("child")
           for derivatives in (parents, children):
             if derivatives:
-              for derivative in derivatives:
-                local_uniq_words.add(derivative)
+              local_uniq_words.update(derivatives)
           trans = entry.get("translation")
           if not trans:
             continue
           has_good_tran = False
           for tran in trans[:6]:
-            if regex.search(r"[\p{Han}\p{Hiragana}]", tran):
+            if _regex_han_hiragana.search(tran):
               has_good_tran = True
               break
           if not has_good_tran:
@@ -383,9 +388,10 @@ class GenerateUnionVocabBatch:
           for item in entry["item"]:
             if item["label"] == "wn":
               num_items += 1
+            if "[synonym]: " not in item["text"]: continue
             for part in item["text"].split("[-]"):
               part = part.strip()
-              match = regex.search(r"\[synonym\]: (.*)", part)
+              match = _regex_synonym_attr.search(part)
               if match:
                 for synonym in match.group(1).split(","):
                   synonym = synonym.strip()
@@ -396,10 +402,10 @@ class GenerateUnionVocabBatch:
             if count >= num_items:
               synonyms.add(synonym)
           if synonyms:
-            dedup_words.append((word, synonyms))
+            dedup_words[(word[0], len(word))].append((word, synonyms))
           duplicated = False
-          for dedup_word, dedup_synonyms in dedup_words:
-            if word[0] == dedup_word[0]:
+          for dedup_len in (len(word) - 1, len(word), len(word) + 1):
+            for dedup_word, dedup_synonyms in dedup_words.get((word[0], dedup_len)) or []:
               dist = tkrzw.Utility.EditDistanceLev(word, dedup_word)
               if dist <= 1 and (word in dedup_synonyms or dedup_word in synonyms):
                 aliases[dedup_word].add(word)
@@ -413,11 +419,9 @@ class GenerateUnionVocabBatch:
       for extra_word in cluster[1]:
         if extra_word not in vetted_words:
           extra_words.append(extra_word)
-      while len(main_words) < num_words and extra_words:
-        main_words.append(extra_words[0])
-        extra_words = extra_words[1:]
-      for skipped_word in skipped_words:
-        extra_words.insert(0, skipped_word)
+      num_filled = max(0, min(num_words - len(main_words), len(extra_words)))
+      main_words.extend(extra_words[:num_filled])
+      extra_words = skipped_words[::-1] + extra_words[num_filled:]
       for word in main_words:
         surfaces = [word]
         surfaces.extend(aliases.get(word) or [])
@@ -426,13 +430,10 @@ class GenerateUnionVocabBatch:
         if len(surfaces) == 1:
           main_surface = surfaces[0]
         else:
-          prob_surfaces = []
-          for surface in surfaces:
-            prob = float(phrase_dbm.GetStr(surface) or "0")
-            prob_surfaces.append((surface, prob))
-          prob_surfaces = sorted(prob_surfaces, key=lambda x: x[1], reverse=True)
-          main_surface = prob_surfaces[0][0]
-          other_surfaces = [x[0] for x in prob_surfaces[1:]]
+          prob_surfaces = sorted(
+            surfaces, key=lambda x: self.GetSurfaceProb(phrase_dbm, x), reverse=True)
+          main_surface = prob_surfaces[0]
+          other_surfaces = prob_surfaces[1:]
         section_main_words.append((main_surface, other_surfaces))
       section_extra_word_lists.append(extra_words)
     for main_word in section_main_words:
@@ -440,24 +441,25 @@ class GenerateUnionVocabBatch:
     out_path = os.path.join(self.output_path, "study-{:03d}.xhtml".format(num_sections))
     logger.info("Creating: {}".format(out_path))
 
-    with open(out_path, "w") as out_file:
+    with open(out_path, "wb") as out_file:
       self.OutputStudy(out_file, num_sections, has_next,
                        section_main_words, section_extra_word_lists,
                        body_dbm, uniq_words, out_children)
     out_path = os.path.join(self.output_path, "check-{:03d}.xhtml".format(num_sections))
     logger.info("Creating: {}".format(out_path))
-    with open(out_path, "w") as out_file:
+    with open(out_path, "wb") as out_file:
       self.OutputCheck(out_file, num_sections, has_next, out_words, out_children, body_dbm)
 
   def OutputStudy(self, out_file, num_sections, has_next, main_words, extra_word_lists,
                   body_dbm, uniq_words, out_children):
+    out_parts = []
     def P(*args, end="\n"):
-      esc_args = []
-      for arg in args[1:]:
-        if isinstance(arg, str):
-          arg = esc(arg)
-        esc_args.append(arg)
-      print(args[0].format(*esc_args), end=end, file=out_file)
+      if len(args) > 1:
+        esc_args = [esc(arg) if isinstance(arg, str) else arg for arg in args[1:]]
+        out_parts.append(args[0].format(*esc_args))
+      else:
+        out_parts.append(args[0])
+      out_parts.append(end)
     def PrintNavi():
       P('<div class="navi">')
       P('<a href="index.xhtml">TOP</a>')
@@ -490,13 +492,10 @@ class GenerateUnionVocabBatch:
     num_words = 0
     for surface, aliases in main_words:
       entry = None
-      data = body_dbm.GetStr(surface)
-      if data:
-        entries = json.loads(data)
-        for word_entry in entries:
-          if word_entry["word"] == surface:
-            entry = word_entry
-            break
+      for word_entry in self.GetEntries(body_dbm, surface):
+        if word_entry["word"] == surface:
+          entry = word_entry
+          break
       if not entry:
         P('<p>Warning: no data for {}</p>', surface)
         continue
@@ -510,7 +509,7 @@ class GenerateUnionVocabBatch:
       pron = entry.get("pronunciation")
       if pron:
         P('<span class="pron">{}</span>', pron)
-      P('</div>', surface)
+      P('</div>')
       trans = entry.get("translation")
       if trans:
         P('<div class="trans">{}</div>', ", ".join(trans[:8]))
@@ -521,7 +520,7 @@ class GenerateUnionVocabBatch:
         label = item["label"]
         pos = item["pos"]
         text = item["text"]
-        if regex.search(r"^\[translation\]", text): continue
+        if text.startswith("[translation]"): continue
         if num_items >= 10: break
         if first_label and label != first_label:
           break
@@ -541,11 +540,11 @@ class GenerateUnionVocabBatch:
         synonyms = []
         examples = []
         for part in parts[1:]:
-          match = regex.search(r"\[synonym\]: (.*)", part)
-          if match:
+          if "[synonym]: " in part:
+            match = _regex_synonym_attr.search(part)
             synonyms.append(match.group(1).strip())
-          match = regex.search(r"\e.g.: (.*)", part)
-          if match:
+          if "e.g.: " in part:
+            match = _regex_example_attr.search(part)
             examples.append(match.group(1).strip())
         for text in synonyms:
           text = CutTextByWidth(text, 128)
@@ -563,29 +562,26 @@ class GenerateUnionVocabBatch:
       children = entry.get("child")
       sibling_alts = set((parents or []) + (children or []))
       if children:
+        children = list(children)
         for child in list(children):
-          child_data = body_dbm.GetStr(child)
-          if not child_data: continue
-          child_entries = json.loads(child_data)
-          for child_entry in child_entries:
+          for child_entry in self.GetEntries(body_dbm, child):
             if child_entry["word"] != child: continue
             grand_children = child_entry.get("child")
             if grand_children:
               for grand_child in grand_children:
                 if grand_child not in children:
                   children.append(grand_child)
-      phrases = entry.get("phrase") or []
+      phrases = list(entry.get("phrase") or [])
       for label, derivatives in (("語幹", parents), ("派生", children)):
         if not derivatives: continue
         for child in derivatives:
-          if not regex.search(r"^[a-zA-Z]", child): continue
+          if not _regex_latin_head.search(child): continue
           if child in uniq_words: continue
           uniq_words[child] = num_sections
           child_trans = None
           child_poses = None
-          child_data = body_dbm.GetStr(child)
-          if child_data:
-            child_entries = json.loads(child_data)
+          child_entries = self.GetEntries(body_dbm, child)
+          if child_entries:
             child_prob = 0
             for child_entry in child_entries:
               if child_entry["word"] != child: continue
@@ -615,12 +611,11 @@ class GenerateUnionVocabBatch:
         for phrase in phrases:
           if not phrase.get("i"): continue
           phrase_word = phrase.get("w")
-          if not regex.search(r"^[a-zA-Z]", phrase_word): continue
+          if not _regex_latin_head.search(phrase_word): continue
           if phrase_word in uniq_words: continue
           uniq_words[phrase_word] = num_sections
-          phrase_data = body_dbm.GetStr(phrase_word)
-          if not phrase_data: continue
-          phrase_entries = json.loads(phrase_data)
+          phrase_entries = self.GetEntries(body_dbm, phrase_word)
+          if not phrase_entries: continue
           phrase_trans = None
           phrase_poses = None
           phrase_prob = 0
@@ -641,8 +636,7 @@ class GenerateUnionVocabBatch:
           P('<span class="childtrans">: {}</span>', ", ".join(phrase_trans[:4]))
           P('</div>')
       infls = []
-      for name, label in INFLECTIONS:
-        prefix = name[:name.find("_")]
+      for name, prefix, label in _inflection_poses:
         if prefix not in poses: continue
         value = entry.get(name)
         if not value: continue
@@ -673,18 +667,15 @@ class GenerateUnionVocabBatch:
         if extra_word in uniq_words: continue
         extra_trans = []
         extra_poses = []
-        extra_data = body_dbm.GetStr(extra_word)
-        if extra_data:
-          extra_entries = json.loads(extra_data)
-          for extra_entry in extra_entries:
-            if extra_entry["word"] != extra_word: continue
-            extra_trans.extend(extra_entry.get("translation") or [])
-            extra_poses.extend(self.GetEntryPOSList(extra_entry))
+        for extra_entry in self.GetEntries(body_dbm, extra_word):
+          if extra_entry["word"] != extra_word: continue
+          extra_trans.extend(extra_entry.get("translation") or [])
+          extra_poses.extend(self.GetEntryPOSList(extra_entry))
         if not extra_trans: continue
         extra_trans = extra_trans[:5]
         has_good_tran = False
         for extra_tran in extra_trans:
-          if regex.search(r"[\p{Han}\p{Hiragana}\p{Katakana}]", extra_tran):
+          if _regex_japanese.search(extra_tran):
             has_good_tran = True
         if not has_good_tran: continue
         extra_words.append((extra_word, extra_trans, extra_poses))
@@ -706,15 +697,17 @@ class GenerateUnionVocabBatch:
     P('</article>')
     P('</body>')
     P('</html>')
+    out_file.write("".join(out_parts).encode("utf-8"))
           
   def OutputCheck(self, out_file, num_sections, has_next, out_words, out_children, body_dbm):
+    out_parts = []
     def P(*args, end="\n"):
-      esc_args = []
-      for arg in args[1:]:
-        if isinstance(arg, str):
-          arg = esc(arg)
-        esc_args.append(arg)
-      print(args[0].format(*esc_args), end=end, file=out_file)
+      if len(args) > 1:
+        esc_args = [esc(arg) if isinstance(arg, str) else arg for arg in args[1:]]
+        out_parts.append(args[0].format(*esc_args))
+      else:
+        out_parts.append(args[0])
+      out_parts.append(end)
     def PrintNavi():
       P('<div class="navi">')
       P('<a href="index.xhtml">TOP</a>')
@@ -754,14 +747,11 @@ class GenerateUnionVocabBatch:
     P('<table class="check_table check_mode_0">')
     num_line = 0
     for word in out_words:
-      data = body_dbm.GetStr(word)
-      if not data: continue
-      poses = []
+      entries = self.GetEntries(body_dbm, word)
+      if not entries: continue
       tran_html = None
-      entries = json.loads(data)
       for entry in entries:
         if entry["word"] != word: continue
-        poses = self.GetEntryPOSList(entry)
         translations = entry.get("translation")
         if translations:
           tran_html = EscapeTranslations(translations[:6])
@@ -783,7 +773,8 @@ class GenerateUnionVocabBatch:
       P('</td>')
       P('<td class="check_text">')
       P('<span class="check_trans">')
-      print(tran_html, file=out_file)
+      out_parts.append(tran_html)
+      out_parts.append("\n")
       P('</span>')
       children = out_children.get(word)
       if children:
@@ -802,7 +793,25 @@ class GenerateUnionVocabBatch:
     P('</article>')
     P('</body>')
     P('</html>')
+    out_file.write("".join(out_parts).encode("utf-8"))
     
+  def GetEntries(self, body_dbm, word):
+    entries = self.entry_cache.get(word)
+    if entries is None:
+      data = body_dbm.GetStr(word)
+      entries = tkrzw_dict.LoadJSON(data) if data else []
+      if len(self.entry_cache) >= ENTRY_CACHE_CAPACITY:
+        self.entry_cache.clear()
+      self.entry_cache[word] = entries
+    return entries
+
+  def GetSurfaceProb(self, phrase_dbm, surface):
+    prob = self.surface_prob_cache.get(surface)
+    if prob is None:
+      prob = float(phrase_dbm.GetStr(surface) or "0")
+      self.surface_prob_cache[surface] = prob
+    return prob
+
   def GetEntryPOSList(self, entry):
     poses = []
     first_label = None
@@ -818,14 +827,15 @@ class GenerateUnionVocabBatch:
   def OutputTOC(self, section_items):
     out_path = os.path.join(self.output_path, "index.xhtml")
     logger.info("Creating: {}".format(out_path))
-    with open(out_path, "w") as out_file:
+    with open(out_path, "wb") as out_file:
+      out_parts = []
       def P(*args, end="\n"):
-        esc_args = []
-        for arg in args[1:]:
-          if isinstance(arg, str):
-            arg = esc(arg)
-          esc_args.append(arg)
-        print(args[0].format(*esc_args), end=end, file=out_file)
+        if len(args) > 1:
+          esc_args = [esc(arg) if isinstance(arg, str) else arg for arg in args[1:]]
+          out_parts.append(args[0].format(*esc_args))
+        else:
+          out_parts.append(args[0])
+        out_parts.append(end)
       P('<?xml version="1.0" encoding="UTF-8"?>')
       P('<!DOCTYPE html>')
       P('<html xmlns="http://www.w3.org/1999/xhtml">')
@@ -860,18 +870,20 @@ class GenerateUnionVocabBatch:
       P('</article>')
       P('</body>')
       P('</html>')
+      out_file.write("".join(out_parts).encode("utf-8"))
 
   def OutputIndex(self, section_items, uniq_words):
     out_path = os.path.join(self.output_path, "list.xhtml")
     logger.info("Creating: {}".format(out_path))
-    with open(out_path, "w") as out_file:
+    with open(out_path, "wb") as out_file:
+      out_parts = []
       def P(*args, end="\n"):
-        esc_args = []
-        for arg in args[1:]:
-          if isinstance(arg, str):
-            arg = esc(arg)
-          esc_args.append(arg)
-        print(args[0].format(*esc_args), end=end, file=out_file)
+        if len(args) > 1:
+          esc_args = [esc(arg) if isinstance(arg, str) else arg for arg in args[1:]]
+          out_parts.append(args[0].format(*esc_args))
+        else:
+          out_parts.append(args[0])
+        out_parts.append(end)
       def PrintNavi():
         P('<div class="navi">')
         P('<a href="index.xhtml">TOP</a>')
@@ -890,14 +902,10 @@ class GenerateUnionVocabBatch:
       PrintNavi()
       P('<h1><a href="">{}の索引</a></h1>', self.title)
       P('<section id="index">')
-      all_items = []
-      for word, section_index in uniq_words.items():
-        all_items.append((word, section_index))
-      all_items = sorted(all_items)
+      all_items = sorted(uniq_words.items(), key=operator.itemgetter(0))
       title_words = set()
-      for _, out_words in enumerate(section_items):
-        for word in out_words:
-          title_words.add(word)
+      for out_words in section_items:
+        title_words.update(out_words)
       first_letter = ""
       first_word = False
       for word, section_index in all_items:
@@ -921,18 +929,20 @@ class GenerateUnionVocabBatch:
       P('</article>')
       P('</body>')
       P('</html>')
+      out_file.write("".join(out_parts).encode("utf-8"))
     
   def OutputIntro(self, num_sections, num_main_words, num_deri_words, num_uniq_words):
     out_path = os.path.join(self.output_path, "intro.xhtml")
     logger.info("Creating: {}".format(out_path))
-    with open(out_path, "w") as out_file:
+    with open(out_path, "wb") as out_file:
+      out_parts = []
       def P(*args, end="\n"):
-        esc_args = []
-        for arg in args[1:]:
-          if isinstance(arg, str):
-            arg = esc(arg)
-          esc_args.append(arg)
-        print(args[0].format(*esc_args), end=end, file=out_file)
+        if len(args) > 1:
+          esc_args = [esc(arg) if isinstance(arg, str) else arg for arg in args[1:]]
+          out_parts.append(args[0].format(*esc_args))
+        else:
+          out_parts.append(args[0])
+        out_parts.append(end)
       def PrintNavi():
         P('<div class="navi">')
         P('<a href="index.xhtml">TOP</a>')
@@ -973,16 +983,17 @@ class GenerateUnionVocabBatch:
       P('</article>')
       P('</body>')
       P('</html>')
+      out_file.write("".join(out_parts).encode("utf-8"))
 
   def OutputMiscFiles(self):
     out_path = os.path.join(self.output_path, "style.css")
     logger.info("Creating: {}".format(out_path))
     with open(out_path, "w") as out_file:
-      print(STYLE_TEXT, file=out_file, end="")
+      out_file.write(STYLE_TEXT)
     out_path = os.path.join(self.output_path, "checkscript.js")
     logger.info("Creating: {}".format(out_path))
     with open(out_path, "w") as out_file:
-      print(CHECKSCRIPT_TEXT, file=out_file, end="")
+      out_file.write(CHECKSCRIPT_TEXT)
 
 
 def main():
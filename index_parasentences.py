@@ -24,8 +24,10 @@
 
 
 import collections
+import heapq
 import logging
 import math
+import operator
 import os
 import random
 import regex
@@ -38,6 +40,7 @@ import tkrzw_tokenizer
 
 
 logger = tkrzw_dict.GetLogger()
+NGRAM_CACHE_CAPACITY = 1000000
 
 
 class MakeIndexBatch:
@@ -55,6 +58,7 @@ class MakeIndexBatch:
     self.phrase_prob_dbm = None
     self.focus_keywords = None
     self.word_index = {}
+    self.ngram_prob_cache = {}
     self.random = random.Random(19780211)
 
   def Run(self):
@@ -106,7 +110,7 @@ class MakeIndexBatch:
     for ngram in range(max_ngram, 0, -1):
       if len(tokens) <= ngram:
         cur_phrase = " ".join(tokens)
-        prob = float(self.phrase_prob_dbm.GetStr(cur_phrase) or 0.0)
+        prob = self.GetNGramProb(cur_phrase)
         if prob:
           return max(prob, base_prob)
         fallback_penalty *= 0.1
@@ -116,7 +120,7 @@ class MakeIndexBatch:
         miss = False
         while index <= len(tokens) - ngram:
           cur_phrase = " ".join(tokens[index:index + ngram])
-          cur_prob = float(self.phrase_prob_dbm.GetStr(cur_phrase) or 0.0)
+          cur_prob = self.GetNGramProb(cur_phrase)
           if not cur_prob:
             miss = True
             break
@@ -133,6 +137,15 @@ class MakeIndexBatch:
         fallback_penalty *= 0.1
     return base_prob
 
+  def GetNGramProb(self, phrase):
+    prob = self.ngram_prob_cache.get(phrase)
+    if prob is None:
+      prob = float(self.phrase_prob_dbm.GetStr(phrase) or 0.0)
+      if len(self.ngram_prob_cache) >= NGRAM_CACHE_CAPACITY:
+        self.ngram_prob_cache.clear()
+      self.ngram_prob_cache[phrase] = prob
+    return prob
+
   def ProcessRecords(self):
     start_time = time.time()
     logger.info("Processing records:")
@@ -213,7 +226,8 @@ class MakeIndexBatch:
           for phrase in phrases:
             prob = self.GetPhraseProb(phrase)
             scored_phrases.append((phrase, prob))
-          scored_phrases = sorted(scored_phrases, key=lambda x: x[1])
+          scored_phrases = heapq.nsmallest(
+            self.max_words, scored_phrases, key=operator.itemgetter(1))
           phrases = [x[0] for x in scored_phrases]
       key = "[{}]".format(num_lines)
       self.output_dbm.Set(key, line).OrDie()
@@ -242,7 +256,7 @@ class MakeIndexBatch:
     num_records = 0
     for word, ids in self.word_index.items():
       ids = sorted(ids[1:])
-      value = ",".join([str(x) for x in ids])
+      value = ",".join(map(str, ids))
       self.output_dbm.Set(word, value).OrDie()
       num_records += 1
       if num_records % 10000 == 0:
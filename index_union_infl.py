@@ -20,9 +20,9 @@
 #--------------------------------------------------------------------------------------------------
 
 import collections
-import json
 import logging
 import math
+import operator
 import os
 import regex
 import sys
@@ -56,10 +56,10 @@ class ExtractKeysBatch:
              "adjective_comparative", "adjective_superlative",
              "adverb_comparative", "adverb_superlative")
     while True:
-      record = it.GetStr()
+      record = it.StepStr()
       if not record: break
       key, serialized = record
-      entry = json.loads(serialized)
+      entry = tkrzw_dict.LoadJSON(serialized)
       for word_entry in entry:
         word = word_entry["word"]
         prob = max(float(word_entry.get("probability") or "0"), 0.0000001)
@@ -87,7 +87,6 @@ class ExtractKeysBatch:
       num_entries += 1
       if num_entries % 10000 == 0:
         logger.info("Reading: entries={}".format(num_entries))
-      it.Next()
     input_dbm.Close().OrDie()
     logger.info("Reading done: entries={}".format(num_entries))
     output_dbm = tkrzw.DBM()
@@ -96,7 +95,7 @@ class ExtractKeysBatch:
                     align_pow=0, num_buckets=num_buckets).OrDie()
     num_entries = 0
     for inflection, scores in index.items():
-      scores = sorted(scores, key=lambda x: x[1], reverse=True)
+      scores.sort(key=operator.itemgetter(1), reverse=True)
       words = []
       uniq_words = set()
       for base_word, score in scores:
@@ -19,6 +19,7 @@
 # and limitations under the License.
 #--------------------------------------------------------------------------------------------------
 
+import collections
 import json
 import logging
 import operator
@@ -32,14 +33,22 @@ import tkrzw_tokenizer
 
 
 logger = tkrzw_dict.GetLogger()
+TRAN_PROB_CACHE_CAPACITY = 100000
+_regex_ja_char = regex.compile(r"[\p{Han}\p{Katakana}\p{Hiragana}ー]")
+_regex_paren_expr = regex.compile(r"\(.*?\)")
+_regex_verb_suffix = regex.compile(
+  r"([\p{Han}\p{Katakana}ー]{2,})(する|すること|される|されること|をする)$")
+_regex_adjv_suffix = regex.compile(r"([\p{Han}\p{Katakana}ー]{2,})(的|的な|的に)$")
+_regex_particle_suffix = regex.compile(
+  r"([\p{Han}]{2,})(が|の|を|に|へ|と|より|から|で|や|な|なる|たる)$")
 
 
 def JoinWords(words):
   text = ""
   for word in words:
     if (text and (
-        not regex.search("[\p{Han}\p{Katakana}\p{Hiragana}ー]", text[-1]) and
-        not regex.search("[\p{Han}\p{Katakana}\p{Hiragana}ー]", word[0]))):
+        not _regex_ja_char.search(text[-1]) and
+        not _regex_ja_char.search(word[0]))):
       text += " "
     text += word[0]
   return text
@@ -55,13 +64,13 @@ class IndexTranslationsBatch:
     self.conj_verb_path = conj_verb_path
     self.conj_adj_path = conj_adj_path    
     self.tokenizer = tkrzw_tokenizer.Tokenizer()
+    self.tran_prob_cache = {}
 
   def Run(self):
     start_time = time.time()
     logger.info("Process started: input_path={}, output_path={}".format(
       self.input_path, self.output_path))
-    mem_index = tkrzw.DBM()
-    mem_index.Open("", True, dbm="BabyDBM").OrDie()
+    mem_index = collections.defaultdict(list)
     input_dbm = tkrzw.DBM()
     input_dbm.Open(self.input_path, False, dbm="HashDBM").OrDie()
     conj_verbs = self.ReadConjWords(self.conj_verb_path)
@@ -92,15 +101,14 @@ class IndexTranslationsBatch:
           for phrase in phrases:
             if phrase.get("p") or phrase.get("i"): continue
             for phrase_tran in phrase.get("x"):
-              phrase_tran = regex.sub(r"\(.*?\)", "", phrase_tran).strip()
+              phrase_tran = _regex_paren_expr.sub("", phrase_tran).strip()
               if phrase_tran:
                 phrase_trans.append(phrase_tran)
         weight_word_trans = []
         for trans, weight in [(word_trans, 1.0), (phrase_trans, 0.5)]:
           for word_tran in trans:
             weight_word_trans.append((word_tran, weight))
-            match = regex.search(
-              r"([\p{Han}\p{Katakana}ー]{2,})(する|すること|される|されること|をする)$", word_tran)
+            match = _regex_verb_suffix.search(word_tran)
             if match:
               short_word_tran = word_tran[:-len(match.group(2))]
               if short_word_tran:
@@ -108,14 +116,12 @@ class IndexTranslationsBatch:
             short_word_tran = self.tokenizer.CutJaWordNounParticle(word_tran)
             if short_word_tran != word_tran:
               weight_word_trans.append((short_word_tran, weight * 0.8))
-            match = regex.search(
-              r"([\p{Han}\p{Katakana}ー]{2,})(的|的な|的に)$", word_tran)
+            match = _regex_adjv_suffix.search(word_tran)
             if match:
               short_word_tran = word_tran[:-len(match.group(2))]
               if short_word_tran:
                 weight_word_trans.append((short_word_tran, weight * 0.8))
-            match = regex.search(
-              r"([\p{Han}]{2,})(が|の|を|に|へ|と|より|から|で|や|な|なる|たる)$", word_tran)
+            match = _regex_particle_suffix.search(word_tran)
             if match:
               short_word_tran = word_tran[:-len(match.group(2))]
               if short_word_tran:
@@ -127,7 +133,7 @@ class IndexTranslationsBatch:
           uniq_trans.add(norm_tran)
           pair = "{}\t{:.8f}".format(word, score * weight)
           score *= 0.98
-          mem_index.Append(norm_tran, pair, "\t").OrDie()
+          mem_index[norm_tran].append(pair)
         num_uniq_trans = len(uniq_trans)
         conj_trans = {}
         if "verb" in poses or "adjective" in poses:
@@ -154,7 +160,7 @@ class IndexTranslationsBatch:
           norm_tran = tkrzw_dict.NormalizeWord(tran)
           if norm_tran in uniq_trans: continue
           pair = "{}\t{:.8f}".format(word, score * weight)
-          mem_index.Append(" " + norm_tran, pair, "\t").OrDie()
+          mem_index[" " + norm_tran].append(pair)
         for item in word_entry["item"]:
           if item["label"] in self.supplement_labels:
             for tran in item["text"].split(","):
@@ -172,7 +178,7 @@ class IndexTranslationsBatch:
     logger.info("Reading done: entries={}, translations={}".format(
       num_entries, num_translations))
     output_dbm = tkrzw.DBM()
-    num_buckets = mem_index.Count() * 2
+    num_buckets = len(mem_index) * 2
     output_dbm.Open(
       self.output_path, True, dbm="HashDBM", truncate=True,
       align_pow=0, num_buckets=num_buckets).OrDie()
@@ -180,19 +186,13 @@ class IndexTranslationsBatch:
     if self.tran_prob_path:
       tran_prob_dbm = tkrzw.DBM()
       tran_prob_dbm.Open(self.tran_prob_path, False, dbm="HashDBM").OrDie()
-    it = mem_index.MakeIterator()
-    it.First()
     num_records = 0
-    while True:
-      record = it.GetStr()
-      if not record: break
-      key, value = record
+    for key in sorted(mem_index):
       scored_trans = []
       uniq_words = set()
-      fields = value.split("\t")
-      for i in range(0, len(fields), 2):
-        word = fields[i]
-        score = float(fields[i + 1])
+      for pair in mem_index[key]:
+        word, score = pair.split("\t")
+        score = float(score)
         if word in uniq_words: continue
         uniq_words.add(word)
         if tran_prob_dbm:
@@ -209,12 +209,10 @@ class IndexTranslationsBatch:
       num_records += 1
       if num_records % 10000 == 0:
         logger.info("Writing: records={}".format(num_records))
-      it.Next()
     if tran_prob_dbm:
       tran_prob_dbm.Close().OrDie()
     output_dbm.Close().OrDie()
     logger.info("Writing done: records={}".format(num_records))
-    mem_index.Close().OrDie()
     logger.info("Process done: elapsed_time={:.2f}s".format(time.time() - start_time))
 
   def ReadConjWords(self, path):
@@ -228,16 +226,28 @@ class IndexTranslationsBatch:
           conjs[word] = trans
     return conjs
 
+  def GetTranProbPairs(self, tran_prob_dbm, src_text):
+    pairs = self.tran_prob_cache.get(src_text)
+    if pairs is None:
+      pairs = []
+      tsv = tran_prob_dbm.GetStr(src_text)
+      if tsv:
+        fields = tsv.split("\t")
+        for i in range(0, len(fields), 3):
+          trg, prob = fields[i + 1], float(fields[i + 2])
+          pairs.append((tkrzw_dict.NormalizeWord(trg), prob))
+      if len(self.tran_prob_cache) >= TRAN_PROB_CACHE_CAPACITY:
+        self.tran_prob_cache.clear()
+      self.tran_prob_cache[src_text] = pairs
+    return pairs
+
   def GetTranProb(self, tran_prob_dbm, src_text, trg_text):
     src_text = tkrzw_dict.NormalizeWord(src_text)
-    tsv = tran_prob_dbm.GetStr(src_text)
+    pairs = self.GetTranProbPairs(tran_prob_dbm, src_text)
     max_prob = 0.0
-    if tsv:
+    if pairs:
       trg_text = tkrzw_dict.NormalizeWord(trg_text)
-      fields = tsv.split("\t")
-      for i in range(0, len(fields), 3):
-        src, trg, prob = fields[i], fields[i + 1], float(fields[i + 2])
-        norm_trg = tkrzw_dict.NormalizeWord(trg)
+      for norm_trg, prob in pairs:
         if norm_trg == trg_text:
           max_prob = max(max_prob, prob)
         elif len(norm_trg) >= 2 and trg_text.startswith(norm_trg):
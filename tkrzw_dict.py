@@ -15,6 +15,7 @@
 
 import collections
 import importlib
+import json
 import logging
 import math
 import operator
@@ -34,6 +35,16 @@ IDF_POWER = 1.5
 MAX_PROB_SCORE = 0.05
 
 
+def _GetJSONDecoder():
+  try:
+    return importlib.import_module("orjson").loads
+  except ImportError:
+    return json.loads
+
+
+LoadJSON = _GetJSONDecoder()
+
+
 def GetLogger():
   log_format = "%(levelname)s\t%(message)s"
   logging.basicConfig(format=log_format, stream=sys.stderr)
@@ -264,30 +275,33 @@ def ComputeBLEUScore(candidate, references, ngram):
   return mean_precision * brevity_penalty
 
 
-def ComputeNGramPresision(candidate, references, ngram):
+def _GetNGramMap(tokens, n):
+  return collections.Counter(zip(*[tokens[i:] for i in range(n)]))
+
+
+def MergeReferenceNGramMaps(references, ngram):
+  merged_ref_maps = []
+  for n in range(1, ngram + 1):
+    merged_ref_map = collections.Counter()
+    for reference in references:
+      merged_ref_map |= _GetNGramMap(reference, n)
+    merged_ref_maps.append(merged_ref_map)
+  return merged_ref_maps
+
+
+def ComputeNGramPresision(candidate, references, ngram, merged_ref_maps=None):
   if not candidate or not references: return 0.0
+  if merged_ref_maps is None:
+    merged_ref_maps = MergeReferenceNGramMaps(references, ngram)
   ngram = min(ngram, len(candidate))
-  def GetNGramMap(tokens, n):
-    result = collections.defaultdict(int)
-    for i in range(0, len(tokens) - n + 1):
-      phrase = "\0".join(tokens[i:i + n])
-      result[phrase] += 1
-    return result
   sum_precision = 0.0
   for n in range(1, ngram + 1):
-    cand_map = GetNGramMap(candidate, n)
-    merged_ref_map = {}
-    for reference in references:
-      for phrase, count in GetNGramMap(reference, n).items():
-        merged_ref_map[phrase] = max(merged_ref_map.get(phrase) or 0, count)
-    total_count = 0
-    total_match_count = 0
-    for phrase, count in cand_map.items():
-      match_count = min(merged_ref_map.get(phrase) or 0, count)
-      total_count += count
-      total_match_count += match_count
+    cand_map = _GetNGramMap(candidate, n)
+    total_count = len(candidate) - n + 1
+    total_match_count = sum((cand_map & merged_ref_maps[n - 1]).values())
+    if not total_match_count: break
     sum_precision += total_match_count / total_count
-  return sum_precision / n
+  return sum_precision / ngram
 
 
 _hiragana = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめも"